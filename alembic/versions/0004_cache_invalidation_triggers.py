@@ -0,0 +1,96 @@
+"""notify cache invalidations from triggers on users, revoked_tokens and token_cutoffs
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# fixed copies - later changes to the triggers go in new revisions
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    cache_keys jsonb;
+    cache_key jsonb;
+    chunk jsonb := '[]';
+    chunk_bytes integer := 0;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(TG_ARGV[2] || (to_jsonb(r) ->> TG_ARGV[1])) INTO cache_keys FROM old_rows r;
+    ELSE
+        SELECT jsonb_agg(TG_ARGV[2] || (to_jsonb(r) ->> TG_ARGV[1])) INTO cache_keys FROM new_rows r;
+    END IF;
+    IF cache_keys IS NULL THEN
+        RETURN NULL;
+    END IF;
+    FOR cache_key IN SELECT jsonb_array_elements(cache_keys) LOOP
+        IF chunk_bytes > 0 AND chunk_bytes + octet_length(cache_key::text) + 2 > 7800 THEN
+            PERFORM pg_notify('cache_invalidation', jsonb_build_object(
+                'sent_at', extract(epoch FROM clock_timestamp()), 'keys', jsonb_build_object(TG_ARGV[0], chunk)
+            )::text);
+            chunk := '[]';
+            chunk_bytes := 0;
+        END IF;
+        chunk := chunk || jsonb_build_array(cache_key);
+        chunk_bytes := chunk_bytes + octet_length(cache_key::text) + 2;
+    END LOOP;
+    PERFORM pg_notify('cache_invalidation', jsonb_build_object(
+        'sent_at', extract(epoch FROM clock_timestamp()), 'keys', jsonb_build_object(TG_ARGV[0], chunk)
+    )::text);
+    RETURN NULL;
+END
+$$
+"""
+
+TRIGGERS = [
+    "CREATE TRIGGER users_invalidate_insert AFTER INSERT ON users "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('profile', 'username', '')",
+    "CREATE TRIGGER users_invalidate_update AFTER UPDATE ON users "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('profile', 'username', '')",
+    "CREATE TRIGGER users_invalidate_delete AFTER DELETE ON users "
+    "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('profile', 'username', '')",
+    "CREATE TRIGGER revoked_tokens_invalidate_insert AFTER INSERT ON revoked_tokens "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('revocations', 'jti', 'jti:')",
+    "CREATE TRIGGER revoked_tokens_invalidate_update AFTER UPDATE ON revoked_tokens "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('revocations', 'jti', 'jti:')",
+    "CREATE TRIGGER token_cutoffs_invalidate_insert AFTER INSERT ON token_cutoffs "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('revocations', 'username', 'user:')",
+    "CREATE TRIGGER token_cutoffs_invalidate_update AFTER UPDATE ON token_cutoffs "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+    "EXECUTE FUNCTION notify_cache_invalidation('revocations', 'username', 'user:')",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for statement in TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name, operations in (
+            ("users", ("insert", "update", "delete")),
+            ("revoked_tokens", ("insert", "update")),
+            ("token_cutoffs", ("insert", "update")),
+    ):
+        for operation in operations:
+            op.execute(f"DROP TRIGGER {table_name}_invalidate_{operation} ON {table_name}")
+    op.execute("DROP FUNCTION notify_cache_invalidation()")
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_read_db, read_router
+from app.models.last_login import last_login_buffer
+from app.models.revocation import token_revocations
 from app.models.user import User
+from app.schemas.jwt import JWToken
 from app.schemas.user import UserInCreate, UserPublic, UserInLogin, UserWithToken
-from app.security.jwt import create_access_token_for_user
+from app.schemas.serializers import RawJSONResponse, user_public_json, user_with_token_json
+from app.security.jwt import create_access_token_for_user, valid_token
+from app.security.throttle import throttle, throttle_login, throttle_register
 from app.security.user import verify_user
+from app.settings import settings
+from app.utils.exceptions import InvalidCredentialsException
 
 router = APIRouter()
 
@@ -13,7 +20,8 @@ router = APIRouter()
 @router.post(
     "/register",
     status_code=status.HTTP_201_CREATED,
-    response_model=UserPublic
+    response_model=UserPublic,
+    dependencies=[Depends(throttle_register)]
 )
 async def register_user(
         *,
@@ -21,22 +29,60 @@ async def register_user(
         user_data: UserInCreate
 ) -> UserPublic:
 
-    return await User.create(db_session, **user_data.dict())
+    user = await User.create(db_session, **user_data.dict())
+    read_router.mark_written(user.username, user.email)
+
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_public_json(user), status_code=status.HTTP_201_CREATED)
+    return user
 
 
 @router.post(
     "/login",
     status_code=status.HTTP_202_ACCEPTED,
-    response_model=UserWithToken
+    response_model=UserWithToken,
+    dependencies=[Depends(throttle_login)]
 )
 async def login_user(
         *,
         db_session: AsyncSession = Depends(get_db),
+        read_session: AsyncSession = Depends(get_read_db),
+        request: Request,
         credentials: UserInLogin
 ) -> UserWithToken:
 
-    user = await verify_user(db_session, credentials)
+    account = credentials.username or credentials.email
+    if read_router.is_recently_written(account):
+        read_session = db_session
+    try:
+        user = await verify_user(read_session, credentials, write_session=db_session)
+    except InvalidCredentialsException as exc:
+        # an existing account counts the failure under its username and its email
+        throttle.record_failure(request.client.host, *(exc.accounts or (account,)))
+        raise
     token = await create_access_token_for_user(credentials.username)
-    await user.update_last_login_at(db_session)
+    if last_login_buffer.enabled:
+        last_login_buffer.record(user)
+    else:
+        await user.update_last_login_at(db_session)
 
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_with_token_json(user, token), status_code=status.HTTP_202_ACCEPTED)
     return UserWithToken(user=user, token=token)
+
+
+@router.post(
+    "/logout",
+    status_code=status.HTTP_204_NO_CONTENT
+)
+async def logout_user(
+        *,
+        db_session: AsyncSession = Depends(get_db),
+        token: JWToken = Depends(valid_token)
+) -> None:
+
+    if token.jti:
+        await token_revocations.revoke_token(db_session, token)
+    else:
+        # a token from before jti existed can only be revoked along with all of the user's others
+        await token_revocations.revoke_user(db_session, token.username)
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from app.warmup import warm_up
+
+router = APIRouter()
+
+
+@router.get(
+    "/live",
+    status_code=status.HTTP_200_OK,
+)
+async def live() -> dict:
+
+    return dict(status="ok")
+
+
+@router.get(
+    "/ready",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_503_SERVICE_UNAVAILABLE: dict(description="The warm-up is not done yet.")},
+)
+async def ready() -> JSONResponse:
+
+    return JSONResponse(
+        content=warm_up.stats(),
+        status_code=status.HTTP_200_OK if warm_up.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, status
+
+from app.database import get_engine, pool_stats
+
+router = APIRouter()
+
+
+@router.get(
+    "/pool",
+    status_code=status.HTTP_200_OK,
+)
+async def get_pool_stats() -> dict:
+
+    return pool_stats(get_engine())
@@ -0,0 +1,222 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.database import get_engine, read_router
+from app.invalidation import invalidation_bus
+from app.models.last_login import last_login_buffer
+from app.models.revocation import token_revocations
+from app.models.user import profile_cache, profile_loader
+from app.security.jwt import token_cache
+from app.security.password import password_hasher
+from app.security.throttle import throttle
+from app.settings import settings
+from app.utils.metrics import histogram_family, metric_family, metrics, render_prometheus
+
+router = APIRouter()
+
+
+async def scrape_token(authorization: Optional[str] = Header(None)) -> None:
+    """Dependency for /metrics - a static bearer token, what a Prometheus scrape config can send."""
+
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if not (
+            settings.METRICS_TOKEN and scheme.lower() == "bearer"
+            and secrets.compare_digest(credentials.encode(), settings.METRICS_TOKEN.encode())
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="A valid metrics token is required.",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+def _pool_lines() -> list[str]:
+    engine = get_engine()
+    pool_metrics = engine.pool.metrics
+    return [
+        *histogram_family(
+            "db_pool_checkout_wait_seconds", "Time waited for a connection from the pool.",
+            {(): pool_metrics.checkout_wait}, ()
+        ),
+        "# HELP db_pool_checked_out Connections currently checked out.",
+        "# TYPE db_pool_checked_out gauge",
+        f"db_pool_checked_out {engine.pool.checkedout()}",
+        "# HELP db_pool_timeouts_total Checkouts that timed out.",
+        "# TYPE db_pool_timeouts_total counter",
+        f"db_pool_timeouts_total {pool_metrics.timeouts}",
+    ]
+
+
+def _read_router_lines() -> list[str]:
+    return [
+        *metric_family(
+            "db_replica_failures_total", "counter", "Read replica connects that failed.",
+            {(): read_router.replica_failures}
+        ),
+        *metric_family(
+            "db_replicas_unhealthy", "gauge", "Read replicas skipped until their cooldown ends.",
+            {(): read_router.unhealthy_replicas}
+        ),
+    ]
+
+
+def _invalidation_lines() -> list[str]:
+    return [
+        *histogram_family(
+            "cache_invalidation_lag_seconds", "Time from a write's commit to the eviction on this worker.",
+            {(): invalidation_bus.lag}, ()
+        ),
+        "# HELP cache_invalidation_connected Whether the LISTEN connection is up.",
+        "# TYPE cache_invalidation_connected gauge",
+        f"cache_invalidation_connected {int(invalidation_bus.connected)}",
+        "# HELP cache_invalidation_reconnects_total Times the LISTEN connection was lost or could not be opened.",
+        "# TYPE cache_invalidation_reconnects_total counter",
+        f"cache_invalidation_reconnects_total {invalidation_bus.reconnects}",
+        "# HELP cache_invalidation_flushes_total Full cache flushes, after every (re)connect.",
+        "# TYPE cache_invalidation_flushes_total counter",
+        f"cache_invalidation_flushes_total {invalidation_bus.flushes}",
+    ]
+
+
+def _profile_loader_lines() -> list[str]:
+    return [
+        *histogram_family(
+            "user_lookup_batch_size", "Usernames per coalesced profile query.",
+            {(): profile_loader.batch_sizes}, ()
+        ),
+        *histogram_family(
+            "user_lookup_wait_seconds", "Time from a profile cache miss to its coalesced result.",
+            {(): profile_loader.wait}, ()
+        ),
+        "# HELP user_lookup_loads_total Profile cache misses looked up through the loader.",
+        "# TYPE user_lookup_loads_total counter",
+        f"user_lookup_loads_total {profile_loader.loads}",
+        "# HELP user_lookup_shared_total Lookups that joined one already pending or in flight for the username.",
+        "# TYPE user_lookup_shared_total counter",
+        f"user_lookup_shared_total {profile_loader.shared}",
+    ]
+
+
+def _password_hasher_lines() -> list[str]:
+    stats = password_hasher.stats()
+    return [
+        *metric_family("password_hash_queued", "gauge", "Hashes waiting for a slot.", {(): stats["queued"]}),
+        *metric_family(
+            "password_hash_queued_max", "gauge", "Most hashes ever waiting at once.", {(): stats["max_queued"]}
+        ),
+        *metric_family(
+            "password_hash_bulk_queued", "gauge", "Bulk import hashes waiting for their own lane.",
+            {(): stats["bulk_queued"]}
+        ),
+        *metric_family("password_hash_in_flight", "gauge", "Hashes running.", {(): stats["in_flight"]}),
+        *metric_family(
+            "password_hash_max_in_flight", "gauge", "Hashes allowed to run at once.", {(): stats["max_in_flight"]}
+        ),
+        *metric_family("password_hash_completed_total", "counter", "Hashes completed.", {(): stats["completed"]}),
+        *metric_family(
+            "password_hash_wait_seconds_total", "counter", "Time hashes waited for a slot.",
+            {(): stats["wait_seconds_total"]}
+        ),
+        *metric_family(
+            "password_hash_wait_seconds_max", "gauge", "Longest time a hash waited for a slot.",
+            {(): stats["wait_seconds_max"]}
+        ),
+    ]
+
+
+def _cache_lines() -> list[str]:
+    stats = dict(profile=profile_cache.stats(), token=token_cache.stats())
+    return [
+        *metric_family(
+            "cache_entries", "gauge", "Entries held.",
+            {name: cache["size"] for name, cache in stats.items()}, ("cache",)
+        ),
+        *metric_family(
+            "cache_max_entries", "gauge", "Entries the cache holds at most.",
+            {name: cache["maxsize"] for name, cache in stats.items()}, ("cache",)
+        ),
+        *metric_family(
+            "cache_hits_total", "counter", "Lookups answered from the cache.",
+            {name: cache["hits"] for name, cache in stats.items()}, ("cache",)
+        ),
+        *metric_family(
+            "cache_misses_total", "counter", "Lookups not found or expired.",
+            {name: cache["misses"] for name, cache in stats.items()}, ("cache",)
+        ),
+        *metric_family(
+            "cache_evictions_total", "counter", "Entries dropped to stay within the size.",
+            {name: cache["evictions"] for name, cache in stats.items()}, ("cache",)
+        ),
+        *metric_family(
+            "cache_expirations_total", "counter", "Entries dropped after their ttl.",
+            {name: cache["expirations"] for name, cache in stats.items()}, ("cache",)
+        ),
+    ]
+
+
+def _throttle_lines() -> list[str]:
+    return metric_family(
+        "throttle_rejected_total", "counter", "Logins and registrations rejected with 429.",
+        {(): throttle.stats()["rejected"]}
+    )
+
+
+def _revocation_lines() -> list[str]:
+    stats = token_revocations.stats()
+    return [
+        *metric_family(
+            "token_revocations_loaded", "gauge", "Whether the Bloom filter was synced at least once.",
+            {(): stats["loaded"]}
+        ),
+        *metric_family(
+            "token_revocations_db_checks_total", "counter", "Revocation checks confirmed in the database.",
+            {(): stats["db_checks"]}
+        ),
+        *metric_family(
+            "token_revocations_bloom_keys", "gauge", "Revoked jtis and usernames in the Bloom filter.",
+            {(): stats["bloom"]["count"]}
+        ),
+        *metric_family(
+            "token_revocations_bloom_capacity", "gauge", "Keys the Bloom filter is sized for.",
+            {(): stats["bloom"]["capacity"]}
+        ),
+        *metric_family(
+            "token_revocations_bloom_oversized_total", "counter",
+            "Bloom filter rebuilds sized over REVOCATION_BLOOM_CAPACITY for the live revocations.",
+            {(): stats["oversized_rebuilds"]}
+        ),
+    ]
+
+
+def _last_login_lines() -> list[str]:
+    stats = last_login_buffer.stats()
+    return [
+        *metric_family(
+            "last_login_pending", "gauge", "Logins waiting for the next last_login_at flush.", {(): stats["pending"]}
+        ),
+        *metric_family("last_login_flushes_total", "counter", "last_login_at flushes.", {(): stats["flushes"]}),
+        *metric_family(
+            "last_login_flushed_rows_total", "counter", "Rows written by the flushes.", {(): stats["flushed_rows"]}
+        ),
+        *metric_family(
+            "last_login_last_flush_seconds", "gauge", "Duration of the latest flush.",
+            {(): stats["last_flush_seconds"]}
+        ),
+    ]
+
+
+@router.get(
+    "",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+)
+async def get_metrics() -> PlainTextResponse:
+
+    extra = (
+        _pool_lines() + _read_router_lines() + _invalidation_lines() + _profile_loader_lines()
+        + _password_hasher_lines() + _cache_lines() + _throttle_lines() + _revocation_lines() + _last_login_lines()
+    )
+    return PlainTextResponse(render_prometheus(metrics, extra=extra), media_type="text/plain; version=0.0.4")
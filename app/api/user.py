@@ -1,15 +1,137 @@
-from fastapi import APIRouter, Depends, Header, status
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_read_db, read_router
+from app.export import EXPORT_MEDIA_TYPES, export_users
+from app.models.revocation import token_revocations
 from app.models.user import User
-from app.schemas.user import UserPublic, UserInUpdate, UserInDelete, UserInDB
-from app.security.jwt import decode_token
-from app.utils.exceptions import NotAuthorizedException
+from app.schemas.jwt import JWToken
+from app.schemas.serializers import (
+    RawJSONResponse, user_batch_json, user_in_db_json, user_page_json, user_public_json
+)
+from app.schemas.user import (
+    UserPublic, UserInUpdate, UserInDelete, UserInDB, UserInCreate, UserBulkCreateError, UserBulkCreateResult,
+    UserPage, UserBatch, UserBatchQuery
+)
+from app.security.jwt import admin_token, current_token
+from app.settings import settings
+from app.utils import ndjson
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter()
 
 
+@router.get(
+    "",
+    status_code=status.HTTP_200_OK,
+    response_model=UserPage,
+)
+async def list_users(
+        *,
+        db_session: AsyncSession = Depends(get_read_db),
+        token: JWToken = Depends(admin_token),
+        limit: int = Query(default=50, ge=1, le=settings.USER_LIST_MAX_LIMIT),
+        cursor: Optional[str] = None,
+        username_prefix: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None
+) -> UserPage:
+
+    rows = await User.list_public(
+        db_session,
+        limit=limit + 1,
+        after=decode_cursor(cursor) if cursor else None,
+        username_prefix=username_prefix,
+        created_after=created_after,
+        created_before=created_before
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        user_id, profile = rows[-1]
+        next_cursor = encode_cursor(profile.created_at, user_id)
+
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_page_json((profile for _, profile in rows), next_cursor))
+    return UserPage(items=[profile for _, profile in rows], next_cursor=next_cursor)
+
+
+async def _get_users_batch(db_session: AsyncSession, read_session: AsyncSession, usernames: list[str]) -> UserBatch:
+    # dict.fromkeys drops duplicates and keeps the order
+    usernames = list(dict.fromkeys(username for username in usernames if username))
+    if len(usernames) > settings.USER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {settings.USER_BATCH_MAX_SIZE} usernames per request."
+        )
+    if any(read_router.is_recently_written(username) for username in usernames):
+        read_session = db_session
+
+    profiles = await User.find_public_many(read_session, usernames)
+    found = {username: profile for username, profile in profiles.items() if profile is not None}
+    missing = [username for username in usernames if profiles[username] is None]
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_batch_json(found, missing))
+    return UserBatch(users=found, missing=missing)
+
+
+@router.get(
+    ":batch",
+    status_code=status.HTTP_200_OK,
+    response_model=UserBatch,
+)
+async def get_users_batch(
+        *,
+        db_session: AsyncSession = Depends(get_db),
+        read_session: AsyncSession = Depends(get_read_db),
+        usernames: str = Query(description="Comma separated usernames.")
+) -> UserBatch:
+    """Public profiles of several users with one query - what a page listing N authors needs."""
+
+    return await _get_users_batch(db_session, read_session, usernames.split(","))
+
+
+@router.post(
+    ":batch",
+    status_code=status.HTTP_200_OK,
+    response_model=UserBatch,
+)
+async def post_users_batch(
+        *,
+        db_session: AsyncSession = Depends(get_db),
+        read_session: AsyncSession = Depends(get_read_db),
+        query: UserBatchQuery
+) -> UserBatch:
+    """GET /users:batch for username lists too long for a query string."""
+
+    return await _get_users_batch(db_session, read_session, query.usernames)
+
+
+# declared before /{username} so that "export" is not taken for a username
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def export_all_users(
+        *,
+        db_session: AsyncSession = Depends(get_read_db),
+        token: JWToken = Depends(admin_token),
+        export_format: str = Query(default="ndjson", alias="format", regex="^(ndjson|csv)$"),
+        fetch_size: int = Query(default=settings.EXPORT_FETCH_SIZE, ge=1, le=100_000)
+) -> StreamingResponse:
+
+    return StreamingResponse(
+        export_users(db_session, export_format, fetch_size),
+        media_type=EXPORT_MEDIA_TYPES[export_format]
+    )
+
+
 @router.get(
     "/{username}",
     status_code=status.HTTP_200_OK,
@@ -17,11 +139,15 @@ router = APIRouter()
 )
 async def get_user(
         *,
+        # not get_read_db: a replica is only picked when the profile is not cached
         db_session: AsyncSession = Depends(get_db),
         username: str
 ) -> UserPublic:
 
-    return await User.find_one(db_session, "username", username)
+    profile = await User.find_public(db_session, username)
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_public_json(profile))
+    return profile
 
 
 @router.patch(
@@ -33,16 +159,19 @@ async def update_user(
         *,
         db_session: AsyncSession = Depends(get_db),
         to_update: UserInUpdate,
-        token: str = Header(),
+        token: JWToken = Depends(current_token),
         username: str
 ) -> UserInDB:
 
-    token = await decode_token(token)
-    if token.username != username:
-        raise NotAuthorizedException
     instance = await User.find_one(db_session, "username", username)
     await instance.update(db_session, **to_update.dict())
+    read_router.mark_written(username, instance.email)
+    if to_update.password:
+        # tokens issued with the old password stop working, this request's included
+        await token_revocations.revoke_user(db_session, username)
 
+    if settings.FAST_JSON_RESPONSES:
+        return RawJSONResponse(user_in_db_json(instance))
     return instance
 
 
@@ -54,14 +183,72 @@ async def update_user(
 async def delete_user(
         *,
         db_session: AsyncSession = Depends(get_db),
-        token: str = Header(),
+        token: JWToken = Depends(current_token),
         username: str
 ) -> UserInDelete:
 
-    token = await decode_token(token)
-    if token.username != username:
-        raise NotAuthorizedException
     instance = await User.find_one(db_session, "username", username)
     await instance.delete(db_session)
+    read_router.mark_written(username)
+    await token_revocations.revoke_user(db_session, username)
 
     return UserInDelete(deleted_user=instance)
+
+
+async def _numbered(lines: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, bytes]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line.strip():
+            yield line_number, line
+
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=UserBulkCreateResult,
+)
+async def bulk_create_users(
+        *,
+        db_session: AsyncSession = Depends(get_db),
+        token: JWToken = Depends(admin_token),
+        request: Request
+) -> UserBulkCreateResult:
+    """
+    Creates users from an NDJSON body of UserInCreate objects, one per line.
+    The body is read and inserted chunk by chunk, only the first
+    BULK_IMPORT_MAX_REPORTED_ERRORS rejected rows are described in the response.
+    """
+
+    result = UserBulkCreateResult(created=0, rejected=0, errors=[])
+    lines = _numbered(ndjson.iter_lines(request.stream(), settings.BULK_IMPORT_MAX_LINE_BYTES))
+
+    def reject(line_number: int, error: Any) -> None:
+        result.rejected += 1
+        if len(result.errors) < settings.BULK_IMPORT_MAX_REPORTED_ERRORS:
+            result.errors.append(UserBulkCreateError(line=line_number, error=error))
+
+    try:
+        async for chunk in ndjson.chunked(lines, settings.BULK_IMPORT_CHUNK_SIZE):
+            valid = []
+            for line_number, line in chunk:
+                try:
+                    valid.append((line_number, UserInCreate.parse_raw(line)))
+                except ValidationError as exc:
+                    reject(line_number, exc.errors())
+
+            errors = await User.bulk_create(db_session, [user_data.dict() for _, user_data in valid])
+            for (line_number, _), error in zip(valid, errors):
+                if error is None:
+                    result.created += 1
+                else:
+                    reject(line_number, error)
+
+    except ValueError as exc:
+        # the chunks read so far are already committed
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{exc} {result.created} users were created before that line."
+        ) from exc
+
+    return result
@@ -1,12 +1,121 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.settings import settings
+from app.utils.cache import LRUCache
+from app.utils.metrics import Histogram, metrics
+from app.utils.slow_queries import SlowQueryLog
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    def __init__(self, slow_checkout_seconds: float):
+        self.slow_checkout_seconds = slow_checkout_seconds
+        self.checkout_wait = Histogram()
+        self.timeouts = 0
+        self.connect_failures = 0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long checkouts wait and how often they fail."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics(settings.DB_SLOW_CHECKOUT_SECONDS)
+
+    def recreate(self) -> "InstrumentedPool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        except Exception:
+            self.metrics.connect_failures += 1
+            raise
+
+        # includes opening a new connection when the pool had to grow
+        wait = time.perf_counter() - start
+        self.metrics.checkout_wait.observe(wait)
+        if wait > self.metrics.slow_checkout_seconds:
+            logger.warning(
+                "Waited %.3fs for a database connection (%s).", wait, self.status()
+            )
+        return connection
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # noqa
+    context.metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # noqa
+    metrics.observe_query(time.perf_counter() - context.metrics_start)
+
+
+def instrument_engine(db_engine: AsyncEngine) -> None:
+    """Attributes the statements run on db_engine to the current request, see MetricsMiddleware."""
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+slow_query_log = SlowQueryLog(settings.SLOW_QUERY_THRESHOLD_SECONDS, explain=settings.SLOW_QUERY_EXPLAIN)
+if settings.SLOW_QUERY_LOG_FILE:
+    slow_query_log.configure_file(
+        settings.SLOW_QUERY_LOG_FILE, settings.SLOW_QUERY_LOG_MAX_BYTES, settings.SLOW_QUERY_LOG_BACKUP_COUNT
+    )
+
 
+def create_db_engine(url: str, connect_timeout: Optional[float] = None) -> AsyncEngine:
+    connect_args = dict(prepared_statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE)
+    if connect_timeout is not None:
+        connect_args.update(timeout=connect_timeout)
+    db_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    if settings.METRICS_ENABLED:
+        instrument_engine(db_engine)
+    if settings.SLOW_QUERY_LOG_ENABLED:
+        slow_query_log.instrument(db_engine)
+    return db_engine
 
-engine = create_async_engine(settings.asyncpg_url)
 
+def pool_stats(db_engine: AsyncEngine) -> dict[str, Any]:
+    pool = db_engine.pool
+    return dict(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+        timeouts=pool.metrics.timeouts,
+        connect_failures=pool.metrics.connect_failures,
+        checkout_wait_seconds=pool.metrics.checkout_wait.snapshot(),
+    )
+
+
+# bound by get_engine()
 async_session = async_sessionmaker(
-    engine,
     expire_on_commit=False
 )
 
@@ -19,3 +128,108 @@ async def get_db():
         await db.close()
 
 
+class ReadRouter:
+    """
+    Picks the session for read-only work: the replicas round-robin, falling back
+    to the primary when none of them can be reached, or when the key (a username
+    or an email) was written on this worker less than read_your_writes_seconds ago.
+    A replica that could not be reached is skipped for cooldown_seconds, so a dead
+    one does not add its connect timeout to every read.
+    """
+
+    def __init__(
+            self,
+            replicas: list[async_sessionmaker[AsyncSession]],
+            read_your_writes_seconds: float,
+            cooldown_seconds: float = 0.0
+    ):
+        self.replicas = replicas
+        self.recent_writes = LRUCache(maxsize=10_000, ttl=read_your_writes_seconds)
+        self.cooldown_seconds = cooldown_seconds
+        self.replica_failures = 0
+        # replica -> time.monotonic() until which it is skipped
+        self._unhealthy_until: dict[async_sessionmaker[AsyncSession], float] = {}
+        self._next = 0
+
+    @property
+    def unhealthy_replicas(self) -> int:
+        now = time.monotonic()
+        return sum(until > now for until in self._unhealthy_until.values())
+
+    def mark_written(self, *keys: str) -> None:
+        for key in keys:
+            self.recent_writes.set(key, True)
+
+    def is_recently_written(self, key: Optional[str]) -> bool:
+        return key is not None and self.recent_writes.get(key, False)
+
+    async def replica_session(self, key: Optional[str] = None) -> Optional[AsyncSession]:
+        if self.is_recently_written(key):
+            return None
+
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if self._unhealthy_until.get(replica, 0.0) > time.monotonic():
+                continue
+            db = replica()
+            try:
+                # connect now - a dead replica has to be skipped before the endpoint runs
+                await db.connection()
+                return db
+            except Exception:
+                self.replica_failures += 1
+                self._unhealthy_until[replica] = time.monotonic() + self.cooldown_seconds
+                logger.warning(
+                    "Read replica unavailable, skipping it for %.1fs.", self.cooldown_seconds, exc_info=True
+                )
+                await db.close()
+        return None
+
+    @asynccontextmanager
+    async def session(self, key: Optional[str], fallback: AsyncSession):
+        """replica_session, or fallback when it is None. Closes the replica session on exit."""
+        db = await self.replica_session(key)
+        if db is None:
+            yield fallback
+            return
+
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+read_router = ReadRouter(
+    replicas=[],
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    cooldown_seconds=settings.REPLICA_COOLDOWN_SECONDS
+)
+
+_engine: Optional[AsyncEngine] = None
+replica_engines: list[AsyncEngine] = []
+
+
+def get_engine() -> AsyncEngine:
+    """
+    The primary engine. It is created, together with the replica engines, by the
+    first call - get_app() makes it - rather than at import, since creating an
+    engine loads the asyncpg dialect.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine(settings.asyncpg_url)
+        async_session.configure(bind=_engine)
+        for url in settings.asyncpg_replica_urls:
+            replica_engines.append(create_db_engine(url, connect_timeout=settings.REPLICA_CONNECT_TIMEOUT))
+            read_router.replicas.append(async_sessionmaker(replica_engines[-1], expire_on_commit=False))
+    return _engine
+
+
+async def get_read_db(request: Request, db_session: AsyncSession = Depends(get_db)):
+    """
+    Session for read-only endpoints. Falls back to the request's primary session,
+    so routes that also write do not hold a second connection.
+    """
+    async with read_router.session(request.path_params.get("username"), db_session) as db:
+        yield db
@@ -0,0 +1,98 @@
+"""
+Streams every user as UserPublic rows, in NDJSON or CSV.
+
+    python -m app.export --format csv --fetch-size 5000 --output users.csv
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import Any, AsyncIterator, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session, get_engine
+from app.models.user import User, UserProfile
+from app.settings import settings
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _encode_ndjson(rows: Sequence[Sequence[Any]]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(UserProfile._fields, row)), default=_json_default) + "\n"
+        for row in rows
+    ).encode()
+
+
+def _encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+async def export_users(db_session: AsyncSession, export_format: str, fetch_size: int) -> AsyncIterator[bytes]:
+    """
+    Yields one encoded chunk per fetch_size rows. The rows come from a server-side
+    cursor, so memory use does not depend on the size of the table.
+    """
+
+    encode = _encode_csv if export_format == "csv" else _encode_ndjson
+    if export_format == "csv":
+        yield _encode_csv([UserProfile._fields])
+
+    stmt = (
+        select(*(getattr(User, name) for name in UserProfile._fields))
+        .order_by(User.id)
+        .execution_options(yield_per=fetch_size)
+    )
+    result = await db_session.stream(stmt)
+    async for rows in result.partitions():
+        yield encode(rows)
+
+
+async def _export_to(output: io.BufferedIOBase, export_format: str, fetch_size: int) -> None:
+    engine = get_engine()
+    try:
+        async with async_session() as db_session:
+            async for chunk in export_users(db_session, export_format, fetch_size):
+                output.write(chunk)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=EXPORT_MEDIA_TYPES, default="ndjson")
+    parser.add_argument(
+        "--fetch-size", type=int, default=settings.EXPORT_FETCH_SIZE, help="rows per round trip to the database"
+    )
+    parser.add_argument("--output", help="file to write to, stdout if omitted")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "wb") as output:
+            asyncio.run(_export_to(output, args.format, args.fetch_size))
+    else:
+        asyncio.run(_export_to(sys.stdout.buffer, args.format, args.fetch_size))
+
+
+if __name__ == "__main__":
+    main()
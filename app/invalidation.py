@@ -0,0 +1,226 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Statement-level triggers on the cached tables send the cache keys a write
+makes stale with pg_notify, inside the write's transaction: the notification
+is delivered when - and only if - the write commits, and costs no round trip
+of its own. Every worker keeps one dedicated connection LISTENing on CHANNEL
+and evicts the keys from its caches. Notifications sent while that connection
+was down are lost, so every (re)connect flushes the caches completely.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+from sqlalchemy import DDL, Table, event
+
+from app.settings import settings
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+# pg_notify refuses payloads of 8000 bytes and more - the keys of one notification stay below this
+MAX_KEY_BYTES = 7800
+
+# TG_ARGV: cache name, key column, key prefix. The rows come from the transition
+# tables; their keys are split over as many notifications as they need, so a large
+# write evicts its keys rather than flushing the cache. alembic/versions/0004 has a
+# fixed copy - a change here needs a new revision that replaces the function.
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    cache_keys jsonb;
+    cache_key jsonb;
+    chunk jsonb := '[]';
+    chunk_bytes integer := 0;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(TG_ARGV[2] || (to_jsonb(r) ->> TG_ARGV[1])) INTO cache_keys FROM old_rows r;
+    ELSE
+        SELECT jsonb_agg(TG_ARGV[2] || (to_jsonb(r) ->> TG_ARGV[1])) INTO cache_keys FROM new_rows r;
+    END IF;
+    IF cache_keys IS NULL THEN
+        RETURN NULL;
+    END IF;
+    FOR cache_key IN SELECT jsonb_array_elements(cache_keys) LOOP
+        IF chunk_bytes > 0 AND chunk_bytes + octet_length(cache_key::text) + 2 > {MAX_KEY_BYTES} THEN
+            PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+                'sent_at', extract(epoch FROM clock_timestamp()), 'keys', jsonb_build_object(TG_ARGV[0], chunk)
+            )::text);
+            chunk := '[]';
+            chunk_bytes := 0;
+        END IF;
+        chunk := chunk || jsonb_build_array(cache_key);
+        chunk_bytes := chunk_bytes + octet_length(cache_key::text) + 2;
+    END LOOP;
+    PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+        'sent_at', extract(epoch FROM clock_timestamp()), 'keys', jsonb_build_object(TG_ARGV[0], chunk)
+    )::text);
+    RETURN NULL;
+END
+$$
+"""
+
+
+def notify_trigger_statements(
+        table_name: str,
+        cache: str,
+        key_column: str,
+        key_prefix: str = "",
+        operations: tuple[str, ...] = ("INSERT", "UPDATE", "DELETE")
+) -> list[str]:
+    """One trigger per operation - a trigger with transition tables may only have one."""
+
+    statements = []
+    for operation in operations:
+        rows = "OLD TABLE AS old_rows" if operation == "DELETE" else "NEW TABLE AS new_rows"
+        statements.append(
+            f"CREATE TRIGGER {table_name}_invalidate_{operation.lower()} AFTER {operation} ON {table_name} "
+            f"REFERENCING {rows} FOR EACH STATEMENT "
+            f"EXECUTE FUNCTION notify_cache_invalidation('{cache}', '{key_column}', '{key_prefix}')"
+        )
+    return statements
+
+
+def notify_on_write(table: Table, cache: str, key_column: str, key_prefix: str = "", **kwargs) -> None:
+    """Creates the triggers along with the table in Base.metadata.create_all; migrations create them explicitly."""
+
+    event.listen(table, "after_create", DDL(NOTIFY_FUNCTION))
+    for statement in notify_trigger_statements(table.name, cache, key_column, key_prefix, **kwargs):
+        event.listen(table, "after_create", DDL(statement))
+
+
+class _Cache:
+    __slots__ = ("evict", "flush")
+
+    def __init__(self, evict: Callable[[Hashable], None], flush: Callable[[], None]):
+        self.evict = evict
+        self.flush = flush
+
+
+class InvalidationBus:
+    """
+    Caches register under a name with how to evict one key and how to drop
+    everything; the triggers address them by that name, keys arrive as strings.
+    lag records the seconds from the write to the eviction, measured against
+    the database clock. The worker that wrote gets its own notifications too,
+    after it already evicted the keys locally - a second eviction is harmless.
+    """
+
+    def __init__(
+            self,
+            dsn: str,
+            channel: str,
+            enabled: bool,
+            reconnect_interval: float,
+            health_check_interval: float
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.enabled = enabled
+        self.reconnect_interval = reconnect_interval
+        self.health_check_interval = health_check_interval
+        # application_name of the LISTEN connection
+        self.name = f"{channel}-listener-{uuid.uuid4().hex[:8]}"
+        self.caches: dict[str, _Cache] = {}
+        self.connected = False
+        self._listener: Optional[asyncio.Task] = None
+        self.lag = Histogram()
+        self.received = 0
+        self.reconnects = 0
+        self.flushes = 0
+
+    def register(self, name: str, evict: Callable[[Hashable], None], flush: Callable[[], None]) -> None:
+        self.caches[name] = _Cache(evict, flush)
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            connected=self.connected,
+            received=self.received,
+            reconnects=self.reconnects,
+            flushes=self.flushes,
+            lag_seconds=self.lag.snapshot(),
+        )
+
+    def evict(self, keys: dict[str, Iterable[Hashable]]) -> None:
+        for name, cache_keys in keys.items():
+            cache = self.caches.get(name)
+            if cache is not None:
+                for key in cache_keys:
+                    cache.evict(key)
+
+    def flush(self, names: Optional[Iterable[str]] = None) -> None:
+        for name in self.caches if names is None else names:
+            cache = self.caches.get(name)
+            if cache is not None:
+                cache.flush()
+        self.flushes += 1
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:  # noqa
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed invalidation %r.", payload)
+            return
+
+        self.received += 1
+        if "flush" in message:
+            self.flush(message["flush"])
+        else:
+            self.evict(message.get("keys", {}))
+        self.lag.observe(max(0.0, time.time() - message.get("sent_at", time.time())))
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        connection = await asyncpg.connect(
+            self.dsn.replace("postgresql+asyncpg://", "postgresql://", 1),
+            server_settings=dict(application_name=self.name)
+        )
+        try:
+            await connection.add_listener(self.channel, self._on_notification)
+            # whatever was notified while nobody listened is lost
+            self.flush()
+            self.connected = True
+            while True:
+                await asyncio.sleep(self.health_check_interval)
+                # a dropped connection only shows when it is used
+                await connection.execute("SELECT 1")
+        finally:
+            self.connected = False
+            connection.terminate()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except Exception:
+                logger.warning(
+                    "Invalidation listener disconnected, reconnecting in %.1fs.", self.reconnect_interval,
+                    exc_info=True
+                )
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_interval)
+
+    def start(self) -> None:
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+
+invalidation_bus = InvalidationBus(
+    dsn=settings.asyncpg_url,
+    channel=CHANNEL,
+    enabled=settings.INVALIDATION_BUS_ENABLED,
+    reconnect_interval=settings.INVALIDATION_RECONNECT_INTERVAL,
+    health_check_interval=settings.INVALIDATION_HEALTH_CHECK_INTERVAL
+)
@@ -1,16 +1,60 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.auth import router as auth_router
+from app.api.health import router as health_router
+from app.api.internal import router as internal_router
+from app.api.metrics import router as metrics_router, scrape_token
 from app.api.user import router as user_router
+from app.database import get_engine
+from app.invalidation import invalidation_bus
+from app.models.last_login import last_login_buffer
+from app.models.revocation import token_revocations
+from app.security.jwt import admin_token
+from app.security.password import password_hasher
 from app.settings import settings
+from app.utils.metrics import MetricsMiddleware
+from app.warmup import warm_up
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    if last_login_buffer.enabled:
+        last_login_buffer.start()
+    token_revocations.start()
+    invalidation_bus.start()
+    if warm_up.enabled:
+        # in the background - /health/ready tells the load balancer when it is done
+        warm_up.start()
+    yield
+    await warm_up.stop()
+    await invalidation_bus.stop()
+    await token_revocations.stop()
+    await last_login_buffer.stop()
+    password_hasher.shutdown()
 
 
 def get_app() -> FastAPI:
-    application = FastAPI()
+    get_engine()
+    application = FastAPI(
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse if settings.FAST_JSON_RESPONSES else JSONResponse
+    )
 
     application.include_router(auth_router, prefix="/auth", tags=["Auth"])
     application.include_router(user_router, prefix="/users", tags=["User"])
+    # pool internals are for admins only, the health checks stay open for the load balancer
+    application.include_router(
+        internal_router, prefix="/internal", tags=["Internal"], dependencies=[Depends(admin_token)]
+    )
+    application.include_router(health_router, prefix="/health", tags=["Internal"])
+    if settings.METRICS_ENABLED:
+        application.include_router(
+            metrics_router, prefix="/metrics", tags=["Internal"], dependencies=[Depends(scrape_token)]
+        )
 
     application.add_middleware(
         CORSMiddleware,
@@ -19,8 +63,17 @@ def get_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if settings.METRICS_ENABLED:
+        # added last so it is outermost and times the whole stack
+        application.add_middleware(MetricsMiddleware)
 
     return application
 
 
-app = get_app()
+def __getattr__(name: str):
+    # "app.main:app" for uvicorn, built on first access so that importing
+    # this module, e.g. for get_app(), does not build an application
+    if name == "app":
+        globals()["app"] = application = get_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,20 +1,55 @@
+from typing import ClassVar, Hashable
+
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import Select, bindparam, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import as_declarative
 
 from typing import Self  # noqa
 
+from app.invalidation import invalidation_bus
+
+
+# (model, lookup column, "row" or "column") -> SELECT with a :value parameter
+_lookup_statements: dict[tuple[type, str, str], Select] = {}
+
 
 @as_declarative()
 class Base:
+    # columns find_one and is_taken may look up - keep them indexed
+    lookup_columns: ClassVar[frozenset[str]] = frozenset({"id"})
+
+    @classmethod
+    def lookup_statement(cls, attr_name: str, projection: str = "row") -> Select:
+        """
+        SELECT of the row, or of the column only, where attr_name = :value. Built once
+        and reused, so the statement's cache key is computed once too.
+        """
+        key = (cls, attr_name, projection)
+        stmt = _lookup_statements.get(key)
+        if stmt is None:
+            if attr_name not in cls.lookup_columns:
+                raise ValueError(f"{cls.__name__}.{attr_name} is not one of the lookup columns {cls.lookup_columns}")
+            attr = getattr(cls, attr_name)
+            stmt = select(cls if projection == "row" else attr).where(attr == bindparam("value"))
+            _lookup_statements[key] = stmt
+        return stmt
+
+    def cache_keys(self) -> dict[str, list[Hashable]]:
+        """Keys of the cached copies of this record, by the invalidation_bus name of their cache."""
+        return {}
+
+    def invalidate(self) -> None:
+        """Drops cached copies of this record - called after every committed write."""
+        invalidation_bus.evict(self.cache_keys())
 
     async def save(self, db_session: AsyncSession) -> None:
 
         try:
             db_session.add(self)
             await db_session.commit()
+            self.invalidate()
             await db_session.refresh(self)
 
         except SQLAlchemyError as exc:
@@ -37,6 +72,7 @@ class Base:
         try:
             await db_session.delete(self)
             await db_session.commit()
+            self.invalidate()
 
         except SQLAlchemyError as exc:
             raise HTTPException(
@@ -44,6 +80,17 @@ class Base:
                 detail=repr(exc)
             ) from exc
 
+    @classmethod
+    async def find_one_or_none(
+            cls,
+            db_session: AsyncSession,
+            attr_name: str,
+            attr_value: str
+    ) -> Self | None:
+
+        result = await db_session.execute(cls.lookup_statement(attr_name), dict(value=attr_value))
+        return result.scalar()
+
     @classmethod
     async def find_one(
             cls,
@@ -52,9 +99,7 @@ class Base:
             attr_value: str
     ) -> Self:
 
-        stmt = select(cls).where(getattr(cls, attr_name) == attr_value)
-        result = await db_session.execute(stmt)
-        instance = result.scalar()
+        instance = await cls.find_one_or_none(db_session, attr_name, attr_value)
         if instance is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -65,8 +110,6 @@ class Base:
 
     @classmethod
     async def is_taken(cls, db_session: AsyncSession, attr_name: str, attr_value: str) -> bool:
-        attr = getattr(cls, attr_name)
-        stmt = select(attr).where(attr == attr_value)
-        if await db_session.scalar(stmt):
+        if await db_session.scalar(cls.lookup_statement(attr_name, "column"), dict(value=attr_value)):
             return True
         return False
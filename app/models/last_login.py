@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import Integer, TIMESTAMP, column, func, update, values
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.database import async_session
+from app.invalidation import invalidation_bus
+from app.models.user import User
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer for users.last_login_at.
+
+    Logins are coalesced per user id and written as one
+    UPDATE ... FROM (VALUES ...) every flush_interval seconds,
+    or as soon as batch_size users are pending.
+    """
+
+    def __init__(
+            self,
+            session_factory: async_sessionmaker[AsyncSession],
+            enabled: bool,
+            flush_interval: float,
+            batch_size: int
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: dict[int, datetime] = {}
+        self._usernames: dict[int, str] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._flush_tasks: set[asyncio.Task] = set()
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.last_flush_seconds = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            pending=len(self._pending),
+            flushes=self.flushes,
+            flushed_rows=self.flushed_rows,
+            last_flush_seconds=self.last_flush_seconds,
+        )
+
+    def record(self, user: User) -> None:
+        last_login_at = datetime.now(timezone.utc)
+        self._pending[user.id] = last_login_at
+        self._usernames[user.id] = user.username
+        # the response shows the new value even though it is not written yet
+        set_committed_value(user, "last_login_at", last_login_at)
+
+        if len(self._pending) >= self.batch_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        usernames, self._usernames = self._usernames, {}
+        rows = list(pending.items())
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db_session:
+                for i in range(0, len(rows), self.batch_size):
+                    await db_session.execute(self._update_stmt(rows[i:i + self.batch_size]))
+                await db_session.commit()
+
+        except BaseException:
+            # cancelled too - keep the newest timestamp per user and retry with the next flush
+            for user_id, last_login_at in pending.items():
+                if self._pending.get(user_id, last_login_at) <= last_login_at:
+                    self._pending[user_id] = last_login_at
+                    self._usernames[user_id] = usernames[user_id]
+            raise
+
+        invalidation_bus.evict(dict(profile=usernames.values()))
+
+        self.flushes += 1
+        self.flushed_rows += len(rows)
+        self.last_flush_seconds = time.perf_counter() - start
+        return len(rows)
+
+    @staticmethod
+    def _update_stmt(rows: list[tuple[int, datetime]]):
+        logins = values(
+            column("id", Integer),
+            column("last_login_at", TIMESTAMP(timezone=True)),
+            name="logins"
+        ).data(rows)
+        users = User.__table__
+
+        return (
+            update(users)
+            .where(users.c.id == logins.c.id)
+            # never move the timestamp back if a synchronous update got there first
+            .values(last_login_at=func.greatest(users.c.last_login_at, logins.c.last_login_at))
+        )
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing last_login_at updates failed.")
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._stopping.clear()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            # not cancelled - a flush in progress finishes rather than losing its rows
+            self._stopping.set()
+            await self._flusher
+            self._flusher = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+
+
+last_login_buffer = LastLoginBuffer(
+    session_factory=async_session,
+    enabled=settings.LAST_LOGIN_WRITE_BEHIND,
+    flush_interval=settings.LAST_LOGIN_FLUSH_INTERVAL,
+    batch_size=settings.LAST_LOGIN_BATCH_SIZE,
+)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import String, TIMESTAMP, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import async_session
+from app.invalidation import invalidation_bus, notify_on_write
+from app.models.base import Base
+from app.schemas.jwt import JWToken
+from app.settings import settings
+from app.utils.bloom import BloomFilter
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# rows committed out of revoked_at order are still picked up by the next sync
+SYNC_OVERLAP = timedelta(seconds=10)
+
+
+class RevokedToken(Base):
+    """A single token, revoked by logging out."""
+
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String, primary_key=True)
+    # the row is useless once the token expired
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), index=True)
+    revoked_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), index=True)
+
+
+class TokenCutoff(Base):
+    """Every token of username issued at or before revoked_at is revoked - set on password change and delete."""
+
+    __tablename__ = "token_cutoffs"
+
+    username: Mapped[str] = mapped_column(String, primary_key=True)
+    revoked_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), index=True)
+
+
+# no DELETE triggers - pruning expired rows revokes nothing
+notify_on_write(RevokedToken.__table__, "revocations", "jti", "jti:", operations=("INSERT", "UPDATE"))
+notify_on_write(TokenCutoff.__table__, "revocations", "username", "user:", operations=("INSERT", "UPDATE"))
+
+
+class TokenRevocations:
+    """
+    Checks tokens against RevokedToken and TokenCutoff without a query per request.
+
+    Every revoked jti and cut-off username is added to a Bloom filter, so a token
+    that was not revoked - nearly all of them - is answered from memory. Filter
+    hits are confirmed through a small exact cache, then the database.
+
+    The filter picks up other workers' revocations every sync_interval seconds,
+    incrementally; it is rebuilt from scratch once per token lifetime, which drops
+    whatever has expired since, and as soon as it holds bloom_capacity keys - sized
+    for twice the live revocations when there are more, which is logged and counted
+    in oversized_rebuilds. Until the first sync every check is confirmed.
+    """
+
+    def __init__(
+            self,
+            session_factory: async_sessionmaker[AsyncSession],
+            sync_interval: float,
+            bloom_capacity: int,
+            bloom_error_rate: float,
+            cache_size: int,
+            token_lifetime: timedelta
+    ):
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.token_lifetime = token_lifetime
+        self._filter = BloomFilter(bloom_capacity, bloom_error_rate)
+        # "jti:<jti>" or "user:<username>" -> revoked_at timestamp, None when not revoked
+        self._cache = LRUCache(maxsize=cache_size)
+        self._synced_until: Optional[datetime] = None
+        self._rebuilt_at: Optional[datetime] = None
+        # keys revoked on this worker while a sync reads - a rebuilt filter has to get them too
+        self._added_during_sync: Optional[list[str]] = None
+        self._syncer: Optional[asyncio.Task] = None
+        self.db_checks = 0
+        self.oversized_rebuilds = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._rebuilt_at is not None
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            loaded=self.loaded,
+            db_checks=self.db_checks,
+            oversized_rebuilds=self.oversized_rebuilds,
+            bloom=self._filter.stats()
+        )
+
+    def clear(self) -> None:
+        self._filter = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+        self._cache.clear()
+        self._synced_until = self._rebuilt_at = None
+        self.db_checks = self.oversized_rebuilds = 0
+
+    def evict(self, key: str) -> None:
+        """Another worker revoked key - the next check confirms it in the database, ahead of the sync."""
+        self._remember(key)
+        self._cache.delete(key)
+
+    def _add(self, key: str, revoked_at: datetime) -> None:
+        self._remember(key)
+        self._cache.set(key, revoked_at.timestamp())
+
+    def _remember(self, key: str) -> None:
+        self._filter.add(key)
+        if self._added_during_sync is not None:
+            self._added_during_sync.append(key)
+
+    async def revoke_token(self, db_session: AsyncSession, token: JWToken) -> None:
+        revoked_at = datetime.now(timezone.utc)
+        await db_session.execute(
+            insert(RevokedToken)
+            .values(jti=token.jti, expires_at=token.exp, revoked_at=revoked_at)
+            .on_conflict_do_nothing()
+        )
+        await db_session.commit()
+        self._add(f"jti:{token.jti}", revoked_at)
+
+    async def revoke_user(self, db_session: AsyncSession, username: str) -> None:
+        revoked_at = datetime.now(timezone.utc)
+        stmt = insert(TokenCutoff).values(username=username, revoked_at=revoked_at)
+        await db_session.execute(
+            stmt.on_conflict_do_update(index_elements=[TokenCutoff.username], set_=dict(revoked_at=revoked_at))
+        )
+        await db_session.commit()
+        self._add(f"user:{username}", revoked_at)
+
+    async def is_revoked(self, db_session: AsyncSession, token: JWToken) -> bool:
+        if token.jti and await self._revoked_at(db_session, f"jti:{token.jti}") is not None:
+            return True
+        cutoff = await self._revoked_at(db_session, f"user:{token.username}")
+        # tokens issued before iat was added have none, they are older than any cutoff
+        return cutoff is not None and (token.iat or 0) <= cutoff
+
+    async def _revoked_at(self, db_session: AsyncSession, key: str) -> Optional[float]:
+        if self.loaded and key not in self._filter:
+            return None
+        revoked_at = self._cache.get(key, _MISSING)
+        if revoked_at is _MISSING:
+            self.db_checks += 1
+            kind, value = key.split(":", 1)
+            if kind == "jti":
+                stmt = select(RevokedToken.revoked_at).where(RevokedToken.jti == value)
+            else:
+                stmt = select(TokenCutoff.revoked_at).where(TokenCutoff.username == value)
+            revoked = await db_session.scalar(stmt)
+            revoked_at = revoked.timestamp() if revoked else None
+            self._cache.set(key, revoked_at)
+        return revoked_at
+
+    async def sync(self) -> int:
+        """Adds the revocations made since the last sync, returns how many rows were read."""
+
+        now = datetime.now(timezone.utc)
+        rebuild = not self.loaded or now - self._rebuilt_at >= self.token_lifetime or self._filter.is_full
+        # a cutoff older than the token lifetime no longer matches any valid token
+        since = now - self.token_lifetime if rebuild else self._synced_until - SYNC_OVERLAP
+
+        self._added_during_sync = []
+        try:
+            async with self.session_factory() as db_session:
+                if rebuild:
+                    await db_session.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+                    await db_session.execute(delete(TokenCutoff).where(TokenCutoff.revoked_at < since))
+                    await db_session.commit()
+                tokens = (await db_session.execute(
+                    select(RevokedToken.jti, RevokedToken.revoked_at)
+                    .where(RevokedToken.revoked_at >= since, RevokedToken.expires_at > now)
+                )).all()
+                cutoffs = (await db_session.execute(
+                    select(TokenCutoff.username, TokenCutoff.revoked_at).where(TokenCutoff.revoked_at >= since)
+                )).all()
+        finally:
+            added, self._added_during_sync = self._added_during_sync, None
+
+        # no await from here on - nothing is revoked between building the filter and swapping it in
+        if rebuild:
+            # a filter full of live revocations right away would be rebuilt on every sync
+            capacity = max(self.bloom_capacity, 2 * (len(tokens) + len(cutoffs)))
+            if capacity > self.bloom_capacity:
+                self.oversized_rebuilds += 1
+                logger.warning(
+                    "%d live token revocations, sizing the Bloom filter for %d keys instead of %d.",
+                    len(tokens) + len(cutoffs), capacity, self.bloom_capacity
+                )
+            bloom = BloomFilter(capacity, self.bloom_error_rate)
+            for key in added:
+                bloom.add(key)
+            self._filter = bloom
+            self._rebuilt_at = now
+        for key, revoked_at in [(f"jti:{jti}", at) for jti, at in tokens] + [(f"user:{u}", at) for u, at in cutoffs]:
+            self._add(key, revoked_at)
+        self._synced_until = now
+        return len(tokens) + len(cutoffs)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Syncing token revocations failed.")
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        if self._syncer is None:
+            self._syncer = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._syncer is not None:
+            self._syncer.cancel()
+            await asyncio.gather(self._syncer, return_exceptions=True)
+            self._syncer = None
+
+
+token_revocations = TokenRevocations(
+    session_factory=async_session,
+    sync_interval=settings.REVOCATION_SYNC_INTERVAL,
+    bloom_capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    bloom_error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+    cache_size=settings.REVOCATION_CACHE_SIZE,
+    token_lifetime=timedelta(minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+)
+invalidation_bus.register("revocations", token_revocations.evict, token_revocations.clear)
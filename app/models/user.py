@@ -1,18 +1,49 @@
+import asyncio
 from datetime import datetime, timezone
-from typing import Optional, Self  # noqa
+from typing import Hashable, NamedTuple, Optional, Self  # noqa
 
 from fastapi import HTTPException, status
-from sqlalchemy import Integer, String, TIMESTAMP, func
+from sqlalchemy import Index, Integer, String, TIMESTAMP, any_, bindparam, func, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.database import async_session, read_router
+from app.invalidation import invalidation_bus, notify_on_write
 from app.models.base import Base
 from app.security.password import generate_salt, get_password_hash
+from app.settings import settings
+from app.utils.cache import LRUCache, NullCache
+from app.utils.coalesce import BatchLoader
+
+_MISSING = object()
+
+
+class UserProfile(NamedTuple):
+    """Columns of UserPublic - what the profile cache keeps instead of User instances."""
+    username: str
+    bio: Optional[str]
+    image: Optional[str]
+    created_at: datetime
+    last_login_at: datetime
+
+
+# username -> UserProfile, or None for a username that does not exist
+profile_cache = LRUCache(
+    maxsize=settings.PROFILE_CACHE_SIZE,
+    ttl=settings.PROFILE_CACHE_TTL
+) if settings.PROFILE_CACHE_ENABLED else NullCache()
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # keyset pagination in list_public, see alembic/versions/0002
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+    lookup_columns = frozenset({"id", "username", "email"})
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     username: Mapped[str] = mapped_column(String, unique=True)
@@ -27,6 +58,9 @@ class User(Base):
     # posts: Mapped[list["Post"]] = relationship()
     # comments: Mapped[list["Comment"]] = relationship()
 
+    def cache_keys(self) -> dict[str, list[Hashable]]:
+        return dict(profile=[self.username])
+
     async def update(self, db_session: AsyncSession, **kwargs):
         if kwargs.get("password"):
             self.password_salt = await generate_salt()
@@ -52,11 +86,29 @@ class User(Base):
     @classmethod
     async def create(cls, db_session: AsyncSession, **kwargs) -> Self:
 
+        password_salt = await generate_salt()
+        values = {k: v for k, v in kwargs.items() if v and k != "password" and hasattr(cls, k)}
+        values.update(
+            password_salt=password_salt,
+            hashed_password=await get_password_hash(
+                password_salt=password_salt,
+                plain_password=kwargs["password"]
+            )
+        )
+        # the unique constraints decide - no check-then-insert race
+        stmt = insert(User).values(**values).on_conflict_do_nothing().returning(User)
+
         try:
-            await cls.check_credentials_for_create(db_session, **kwargs)
-            instance = User()
-            await instance.update(db_session, **kwargs)
-            await instance.save(db_session)
+            instance = await db_session.scalar(stmt)
+            if instance is None:
+                # only the error path pays for finding out which constraint failed
+                await cls.check_credentials_for_create(db_session, **kwargs)
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f'{kwargs["username"]} or {kwargs["email"]} is already taken.'
+                )
+            await db_session.commit()
+            instance.invalidate()
             return instance
 
         except SQLAlchemyError as exc:
@@ -65,6 +117,244 @@ class User(Base):
                 detail=repr(exc)
             ) from exc
 
-    async def update_last_login_at(self, db_session: AsyncSession):
-        return await super().update(db_session, **{"last_login_at": datetime.now(timezone.utc)})
+    @classmethod
+    async def bulk_create(cls, db_session: AsyncSession, rows: list[dict]) -> list[Optional[str]]:
+        """
+        Inserts rows with one multi-row INSERT, hashing their passwords concurrently in
+        the bulk lane of password_hasher, so logins are not stuck behind the import.
+        Returns None for every inserted row and the reason for every rejected one.
+        """
+
+        errors: list[Optional[str]] = [None] * len(rows)
+        taken_usernames, taken_emails = set(), set()
+        for i, row in enumerate(rows):
+            if row["username"] in taken_usernames:
+                errors[i] = f'{row["username"]} appears more than once in the upload.'
+            elif row["email"] in taken_emails:
+                errors[i] = f'{row["email"]} appears more than once in the upload.'
+            taken_usernames.add(row["username"])
+            taken_emails.add(row["email"])
+        to_insert = [(i, row) for i, row in enumerate(rows) if errors[i] is None]
+        if not to_insert:
+            return errors
+
+        salts = [await generate_salt() for _ in to_insert]
+        hashed_passwords = await asyncio.gather(*(
+            get_password_hash(password_salt=salt, plain_password=row["password"], bulk=True)
+            for salt, (_, row) in zip(salts, to_insert)
+        ))
+        users = User.__table__
+        stmt = (
+            insert(users)
+            .values([
+                dict(
+                    username=row["username"],
+                    email=row["email"],
+                    password_salt=salt,
+                    hashed_password=hashed_password
+                )
+                for (_, row), salt, hashed_password in zip(to_insert, salts, hashed_passwords)
+            ])
+            .on_conflict_do_nothing()
+            .returning(users.c.username)
+        )
+
+        try:
+            inserted = set((await db_session.scalars(stmt)).all())
+            rejected = [row for _, row in to_insert if row["username"] not in inserted]
+            existing_usernames, existing_emails = set(), set()
+            if rejected:
+                stmt = select(users.c.username, users.c.email).where(or_(
+                    users.c.username.in_([row["username"] for row in rejected]),
+                    users.c.email.in_([row["email"] for row in rejected])
+                ))
+                existing = (await db_session.execute(stmt)).all()
+                existing_usernames = {username for username, _ in existing}
+                existing_emails = {email for _, email in existing}
+            await db_session.commit()
+
+        except SQLAlchemyError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=repr(exc)
+            ) from exc
+
+        for i, row in to_insert:
+            if row["username"] in inserted:
+                invalidation_bus.evict(dict(profile=[row["username"]]))
+            elif row["email"] in existing_emails:
+                errors[i] = f'{row["email"]} already exist in the database.'
+            elif row["username"] in existing_usernames:
+                errors[i] = f'{row["username"]} is already taken.'
+            else:
+                errors[i] = f'{row["username"]} or {row["email"]} is already taken.'
+
+        return errors
+
+    async def _update_columns(self, db_session: AsyncSession, **values) -> Self:
+        # a single UPDATE - no flush of the whole instance and no refresh afterwards
+        stmt = (
+            update(User)
+            .where(User.id == self.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            await db_session.execute(stmt)
+            await db_session.commit()
+
+        except SQLAlchemyError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=repr(exc)
+            ) from exc
+
+        for k, v in values.items():
+            set_committed_value(self, k, v)
+        self.invalidate()
+        return self
+
+    async def update_last_login_at(self, db_session: AsyncSession) -> Self:
+        return await self._update_columns(db_session, last_login_at=datetime.now(timezone.utc))
+
+    async def update_password_hash(self, db_session: AsyncSession, hashed_password: str) -> Self:
+        return await self._update_columns(db_session, hashed_password=hashed_password)
+
+    @classmethod
+    async def find_public(cls, db_session: AsyncSession, username: str) -> UserProfile:
+        """
+        find_one for the UserPublic columns, read through profile_cache. Cache misses
+        go through profile_loader when it is enabled, on its own session, otherwise
+        to a read replica - db_session is only used when none can be picked, so the
+        caller's session need not hold a connection when the cache answers.
+        """
+
+        profile = profile_cache.get(username, _MISSING)
+        if profile is _MISSING and profile_loader.enabled:
+            profile = await profile_loader.load(username)
+        elif profile is _MISSING:
+            generation = profile_cache.generation
+            stmt = select(*(getattr(cls, name) for name in UserProfile._fields)).where(cls.username == username)
+            async with read_router.session(username, db_session) as read_session:
+                row = (await read_session.execute(stmt)).first()
+            profile = UserProfile(*row) if row else None
+            profile_cache.set(
+                username,
+                profile,
+                ttl=None if profile else settings.PROFILE_CACHE_NEGATIVE_TTL,
+                generation=generation
+            )
+
+        if profile is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"There is no record for: {username}"
+            )
+        return profile
+
+    @classmethod
+    async def find_public_many(cls, db_session: AsyncSession, usernames: list[str]) -> dict[str, Optional[UserProfile]]:
+        """
+        find_public for many usernames at once, None for the missing ones. Cached
+        profiles are served from profile_cache, the rest with one = ANY query.
+        """
+
+        profiles, uncached = {}, []
+        for username in usernames:
+            profile = profile_cache.get(username, _MISSING)
+            if profile is _MISSING:
+                uncached.append(username)
+            else:
+                profiles[username] = profile
+
+        if uncached:
+            generation = profile_cache.generation
+            stmt = (
+                select(*(getattr(cls, name) for name in UserProfile._fields))
+                .where(cls.username == any_(bindparam("usernames", type_=ARRAY(String))))
+            )
+            rows = await db_session.execute(stmt, dict(usernames=uncached))
+            found = {row.username: UserProfile(*row) for row in rows}
+            for username in uncached:
+                profile = profiles[username] = found.get(username)
+                profile_cache.set(
+                    username,
+                    profile,
+                    ttl=None if profile else settings.PROFILE_CACHE_NEGATIVE_TTL,
+                    generation=generation
+                )
+        return profiles
+
+    @classmethod
+    async def list_public(
+            cls,
+            db_session: AsyncSession,
+            limit: int,
+            after: Optional[tuple[datetime, int]] = None,
+            username_prefix: Optional[str] = None,
+            created_after: Optional[datetime] = None,
+            created_before: Optional[datetime] = None
+    ) -> list[tuple[int, UserProfile]]:
+        """
+        Users ordered by (created_at, id), starting after the given key - the index
+        is walked from there, so every page costs the same as the first one.
+        """
+
+        stmt = (
+            select(cls.id, *(getattr(cls, name) for name in UserProfile._fields))
+            .order_by(cls.created_at, cls.id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(cls.created_at, cls.id) > tuple_(*after))
+        if username_prefix:
+            stmt = stmt.where(cls.username.startswith(username_prefix, autoescape=True))
+        if created_after is not None:
+            stmt = stmt.where(cls.created_at >= created_after)
+        if created_before is not None:
+            stmt = stmt.where(cls.created_at < created_before)
+
+        rows = (await db_session.execute(stmt)).all()
+        return [(user_id, UserProfile(*profile)) for user_id, *profile in rows]
+
+
+notify_on_write(User.__table__, "profile", "username")
+
+
+class ProfileLoader(BatchLoader):
+    """Coalesces find_public cache misses into find_public_many calls."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], **kwargs):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+
+    async def load_many(self, usernames: list[str]) -> dict[str, Optional[UserProfile]]:
+        db_session = None
+        # read-your-writes, as get_read_db
+        if not any(read_router.is_recently_written(username) for username in usernames):
+            db_session = await read_router.replica_session()
+        async with db_session or self.session_factory() as db_session:
+            return await User.find_public_many(db_session, usernames)
+
+
+profile_loader = ProfileLoader(
+    session_factory=async_session,
+    enabled=settings.USER_LOOKUP_COALESCING,
+    window=settings.USER_LOOKUP_BATCH_WINDOW,
+    max_batch_size=settings.USER_LOOKUP_MAX_BATCH_SIZE,
+    max_in_flight=settings.USER_LOOKUP_MAX_IN_FLIGHT
+)
+
+
+def _evict_profile(username: str) -> None:
+    profile_cache.delete(username)
+    # a lookup in flight may have read the row before the write
+    profile_loader.forget(username)
+
+
+def _flush_profiles() -> None:
+    profile_cache.clear()
+    profile_loader.forget_all()
+
 
+invalidation_bus.register("profile", _evict_profile, _flush_profiles)
@@ -1,4 +1,5 @@
 import datetime
+from typing import Optional
 
 from app.schemas.base import BaseSchema
 
@@ -6,4 +7,7 @@ from app.schemas.base import BaseSchema
 class JWToken(BaseSchema):
     username: str
     exp: datetime.datetime
+    # missing from tokens issued before revocation existed
+    jti: Optional[str]
+    iat: Optional[float]
 
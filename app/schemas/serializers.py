@@ -0,0 +1,61 @@
+"""
+Precompiled JSON serializers for the hot user responses, used instead of
+response_model validation when settings.FAST_JSON_RESPONSES is on.
+
+Rows are validated by the schemas on their way into the database, so here the
+columns are only picked in schema field order and dumped with orjson. The output
+is the same JSON FastAPI produces through the schemas.
+"""
+from operator import attrgetter
+from typing import Any, Callable, Iterable, Optional
+
+import orjson
+from fastapi.responses import Response
+
+from app.schemas.base import BaseSchema
+from app.schemas.user import UserInDB, UserPublic
+
+
+class RawJSONResponse(Response):
+    """Response for content that is already serialized JSON."""
+
+    media_type = "application/json"
+
+
+def compile_serializer(schema: type[BaseSchema]) -> Callable[[Any], dict[str, Any]]:
+    """Object with the schema's fields as attributes -> dict of them, flat schemas only."""
+
+    names = tuple(schema.__fields__)
+    get_values = attrgetter(*names)
+
+    def to_dict(instance: Any) -> dict[str, Any]:
+        return dict(zip(names, get_values(instance)))
+
+    return to_dict
+
+
+user_public_dict = compile_serializer(UserPublic)
+user_in_db_dict = compile_serializer(UserInDB)
+
+
+def user_public_json(user: Any) -> bytes:
+    return orjson.dumps(user_public_dict(user))
+
+
+def user_in_db_json(user: Any) -> bytes:
+    return orjson.dumps(user_in_db_dict(user))
+
+
+def user_with_token_json(user: Any, token: str) -> bytes:
+    return orjson.dumps(dict(token=token, user=user_in_db_dict(user)))
+
+
+def user_batch_json(users: dict[str, Any], missing: list[str]) -> bytes:
+    return orjson.dumps(dict(
+        users={username: user_public_dict(user) for username, user in users.items()},
+        missing=missing
+    ))
+
+
+def user_page_json(users: Iterable[Any], next_cursor: Optional[str]) -> bytes:
+    return orjson.dumps(dict(items=[user_public_dict(user) for user in users], next_cursor=next_cursor))
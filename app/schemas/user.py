@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
 from fastapi import HTTPException, status
 from pydantic import EmailStr, HttpUrl, root_validator
@@ -55,6 +55,22 @@ class UserPublic(BaseSchema):
     last_login_at: datetime
 
 
+class UserPage(BaseSchema):
+    items: list[UserPublic]
+    # pass as cursor to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
+class UserBatchQuery(BaseSchema):
+    usernames: list[str]
+
+
+class UserBatch(BaseSchema):
+    users: dict[str, UserPublic]
+    # requested usernames without a user
+    missing: list[str]
+
+
 class UserWithToken(BaseSchema):
     token: str
     user: UserInDB
@@ -64,6 +80,17 @@ class UserInDelete(BaseSchema):
     deleted_user: UserPublic
 
 
+class UserBulkCreateError(BaseSchema):
+    line: int
+    error: Any
+
+
+class UserBulkCreateResult(BaseSchema):
+    created: int
+    rejected: int
+    errors: list[UserBulkCreateError]
+
+
 class UserInDBForTests(UserBase):
     id: int
     bio: Optional[str]
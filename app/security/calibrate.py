@@ -0,0 +1,68 @@
+"""
+Measures bcrypt on this host and recommends PASSWORD_BCRYPT_ROUNDS for a target hash time.
+
+    python -m app.security.calibrate --target-ms 250
+"""
+import argparse
+import logging
+import statistics
+import time
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+def measure(rounds: int, samples: int = 3) -> float:
+    """Median seconds per bcrypt hash with the given cost."""
+    timings = []
+    for _ in range(samples):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration-password", salt)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(
+        target_seconds: float,
+        min_rounds: int = 4,
+        max_rounds: int = 16,
+        samples: int = 3
+) -> tuple[int, dict[int, float]]:
+    """
+    Highest cost whose hash time stays within target_seconds, with the timings measured
+    on the way. min_rounds, with a warning, when even that one is over the target.
+    """
+    timings = {}
+    recommended = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings[rounds] = measure(rounds, samples)
+        if timings[rounds] > target_seconds:
+            # every extra round doubles the cost, no point in going further
+            break
+        recommended = rounds
+    if timings[min_rounds] > target_seconds:
+        logger.warning(
+            "bcrypt with %d rounds takes %.1f ms on this host, over the %.1f ms target.",
+            min_rounds, timings[min_rounds] * 1000, target_seconds * 1000
+        )
+    return recommended, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0, help="hash time budget per login")
+    parser.add_argument("--min-rounds", type=int, default=4)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    recommended, timings = calibrate(args.target_ms / 1000, args.min_rounds, args.max_rounds, args.samples)
+    for rounds, seconds in timings.items():
+        print(f"rounds={rounds:<3} {seconds * 1000:10.1f} ms")
+    print(f"PASSWORD_BCRYPT_ROUNDS={recommended}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,34 @@
 import datetime
-from typing import Callable
+import hashlib
+import time
+import uuid
+from typing import Any, Callable
 
-from fastapi import HTTPException, status
-from jose import jwt
+from fastapi import Depends, Header, HTTPException, status
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.database import get_db
+from app.models.revocation import token_revocations
 from app.schemas.jwt import JWToken
 from app.settings import settings
+from app.utils.cache import LRUCache, NullCache
+from app.utils.exceptions import NotAuthorizedException
+from app.utils.metrics import metrics
+
+# sha256 of a token -> JWToken, kept until the token expires
+token_cache = LRUCache(maxsize=settings.TOKEN_CACHE_SIZE) if settings.TOKEN_CACHE_ENABLED else NullCache()
 
 
 async def create_jwt_token(
         *,
-        payload: dict[str, str],
+        payload: dict[str, Any],
         secret_key: str,
         expires_delta: datetime.timedelta,
 ) -> Callable[[...], str]:
+    # imported on first use, python-jose pulls in its rsa and ecdsa backends
+    from jose import jwt
+
     to_encode = payload.copy()
     if expires_delta:
         expires = datetime.datetime.utcnow() + expires_delta
@@ -22,12 +36,14 @@ async def create_jwt_token(
         expires = datetime.datetime.utcnow() + settings.ACCESS_TOKEN_EXPIRE_MINUTES
     to_encode.update(dict(exp=expires))
 
-    return jwt.encode(to_encode, secret_key, algorithm=settings.ALGORITHM)
+    with metrics.timed("jwt_encode"):
+        return jwt.encode(to_encode, secret_key, algorithm=settings.ALGORITHM)
 
 
 async def create_access_token_for_user(username) -> str:
     return await create_jwt_token(
-        payload=dict(username=username),
+        # jti identifies the token for logout, iat orders it against the user's cutoff
+        payload=dict(username=username, jti=uuid.uuid4().hex, iat=time.time()),
         secret_key=settings.SECRET_KEY,
         expires_delta=datetime.timedelta(
             minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -36,14 +52,22 @@ async def create_access_token_for_user(username) -> str:
 
 
 async def decode_token(token: str) -> JWToken:
+    key = hashlib.sha256(token.encode()).digest()
+    decoded = token_cache.get(key)
+    if decoded is not None:
+        return decoded
+
+    from jose import jwt
+
     try:
-        return JWToken(
-            **jwt.decode(
-                token=token,
-                key=settings.SECRET_KEY,
-                algorithms=[settings.ALGORITHM]
+        with metrics.timed("jwt_decode"):
+            decoded = JWToken(
+                **jwt.decode(
+                    token=token,
+                    key=settings.SECRET_KEY,
+                    algorithms=[settings.ALGORITHM]
+                )
             )
-        )
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,3 +78,34 @@ async def decode_token(token: str) -> JWToken:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Unable to decode JWT token."
         )
+
+    token_cache.set(key, decoded, ttl=decoded.exp.timestamp() - time.time())
+    return decoded
+
+
+async def valid_token(token: str = Header(), db_session: AsyncSession = Depends(get_db)) -> JWToken:
+    """Dependency for any authenticated route - the token must decode and must not be revoked."""
+
+    decoded = await decode_token(token)
+    if await token_revocations.is_revoked(db_session, decoded):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Your token has been revoked."
+        )
+    return decoded
+
+
+async def current_token(username: str, token: JWToken = Depends(valid_token)) -> JWToken:
+    """Dependency for /{username} routes - the token must belong to that user."""
+
+    if token.username != username:
+        raise NotAuthorizedException
+    return token
+
+
+async def admin_token(token: JWToken = Depends(valid_token)) -> JWToken:
+    """Dependency for admin endpoints - the token must belong to one of settings.admin_usernames."""
+
+    if token.username not in settings.admin_usernames:
+        raise NotAuthorizedException
+    return token
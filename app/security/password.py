@@ -1,16 +1,214 @@
-import bcrypt
-from passlib.context import CryptContext
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.settings import settings
+from app.utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+# built on first use, importing passlib and bcrypt slows down worker start
+pwd_context: Optional["CryptContext"] = None
+
+
+def get_pwd_context() -> "CryptContext":
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+
+        # hashes with any other cost are reported by needs_update and rehashed on login
+        pwd_context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS
+        )
+    return pwd_context
+
+
+# executed inside the pool, so they must stay importable module-level functions
+def _hash(secret: str) -> str:
+    return get_pwd_context().hash(secret)
+
+
+def _verify(secret: str, hashed_password: str) -> bool:
+    return get_pwd_context().verify(secret, hashed_password)
+
+
+def _verify_and_update(secret: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return get_pwd_context().verify_and_update(secret, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop.
+
+    backend is "process", "thread" or "inline" - the last one runs on the event loop
+    and is meant for tests. At most max_in_flight hashes run at once, the rest wait
+    in a queue whose depth and wait time are kept in stats().
+
+    Bulk hashes - run(..., bulk=True) - first wait in a lane of their own that lets
+    bulk_max_in_flight of them at a time into that queue. A large import then holds
+    no more slots than that, and a login never queues behind more than that many
+    bulk hashes.
+    """
+
+    backends = ("process", "thread", "inline")
+
+    def __init__(
+            self,
+            backend: str,
+            workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            bulk_max_in_flight: Optional[int] = None
+    ):
+        self._executor: Optional[Executor] = None
+        self.configure(backend, workers, max_in_flight, bulk_max_in_flight)
+
+    def configure(
+            self,
+            backend: str,
+            workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            bulk_max_in_flight: Optional[int] = None
+    ) -> None:
+        if backend not in self.backends:
+            raise ValueError(f"Unknown password hashing backend: {backend}")
+
+        self.shutdown()
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers
+        self.bulk_max_in_flight = bulk_max_in_flight or max(1, self.max_in_flight // 2)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bulk_semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.bulk_queued = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            backend=self.backend,
+            max_in_flight=self.max_in_flight,
+            bulk_max_in_flight=self.bulk_max_in_flight,
+            bulk_queued=self.bulk_queued,
+            queued=self.queued,
+            max_queued=self.max_queued,
+            in_flight=self.in_flight,
+            completed=self.completed,
+            wait_seconds_total=self.wait_seconds_total,
+            wait_seconds_max=self.wait_seconds_max,
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.backend == "process":
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # spawn - forking a process that runs an event loop copies its state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    def _get_semaphores(self) -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        # a semaphore is bound to the loop it is first used on
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._bulk_semaphore = asyncio.Semaphore(self.bulk_max_in_flight)
+            self._loop = loop
+        return self._semaphore, self._bulk_semaphore
+
+    async def run(self, func: Callable[..., Any], *args: Any, bulk: bool = False) -> Any:
+        if self.backend == "inline":
+            self.completed += 1
+            return func(*args)
+        if not bulk:
+            return await self._run(func, *args)
+
+        bulk_semaphore = self._get_semaphores()[1]
+        self.bulk_queued += 1
+        try:
+            await bulk_semaphore.acquire()
+        finally:
+            self.bulk_queued -= 1
+        try:
+            return await self._run(func, *args)
+        finally:
+            bulk_semaphore.release()
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        semaphore = self._get_semaphores()[0]
+        start = time.perf_counter()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        wait = time.perf_counter() - start
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            semaphore.release()
+
+
+password_hasher = PasswordHasher(
+    backend=settings.PASSWORD_HASHING_BACKEND,
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    max_in_flight=settings.PASSWORD_HASHING_MAX_IN_FLIGHT,
+    bulk_max_in_flight=settings.PASSWORD_HASHING_BULK_MAX_IN_FLIGHT,
+)
 
 
 async def generate_salt() -> str:
+    import bcrypt
+
     return bcrypt.gensalt().decode()
 
 
-async def get_password_hash(password_salt: str, plain_password: str) -> str:
-    return pwd_context.hash(password_salt + plain_password)
+async def get_password_hash(password_salt: str, plain_password: str, bulk: bool = False) -> str:
+    with metrics.timed("bcrypt_hash"):
+        return await password_hasher.run(_hash, password_salt + plain_password, bulk=bulk)
 
 
 async def verify_password(password_salt: str, plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password_salt + plain_password, hashed_password)
+    with metrics.timed("bcrypt_verify"):
+        return await password_hasher.run(_verify, password_salt + plain_password, hashed_password)
+
+
+async def verify_and_update_password(
+        password_salt: str,
+        plain_password: str,
+        hashed_password: str
+) -> tuple[bool, Optional[str]]:
+    """verify_password that also returns a new hash if the stored one uses an outdated cost."""
+    with metrics.timed("bcrypt_verify"):
+        return await password_hasher.run(_verify_and_update, password_salt + plain_password, hashed_password)
@@ -0,0 +1,274 @@
+"""
+Throttling of the endpoints that run bcrypt. All checks are in-memory and run
+before the endpoint touches the database or hashes anything.
+
+State is three floats per key. It lives in a bounded LRU per worker, or, when
+THROTTLE_SHARED_MEMORY_NAME is set, in a fixed-size shared memory table that
+all the workers on the host attach to.
+
+The shared memory segment outlives the workers on purpose - a restarted worker
+attaches to it again - so nothing unlinks it on shutdown. One left over with a
+different size, from before a THROTTLE_STORE_SIZE change, is replaced on start;
+after retiring the service, remove it with SharedMemoryStore.unlink() or by
+deleting /dev/shm/<THROTTLE_SHARED_MEMORY_NAME>.
+"""
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import time
+from typing import ContextManager, Iterator, Optional
+
+from fastapi import Request
+
+from app.schemas.user import UserInLogin
+from app.settings import settings
+from app.utils.cache import LRUCache
+from app.utils.exceptions import TooManyRequestsException
+
+logger = logging.getLogger(__name__)
+
+State = tuple[float, float, float]
+
+
+class MemoryStore:
+    """Per-worker state, the least recently used keys are evicted first."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        # state older than ttl has decayed back to the initial state anyway
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[State]:
+        return self._entries.get(key)
+
+    def set(self, key: str, state: State) -> None:
+        self._entries.set(key, state)
+
+    def locked(self) -> ContextManager:
+        # a read-modify-write never awaits, so the event loop cannot interleave another one
+        return contextlib.nullcontext()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class SharedMemoryStore:
+    """
+    Direct-mapped table in shared memory: a key goes to the slot picked by its
+    hash, and a different key hashing to the same slot replaces it. Updates hold
+    an flock, so the workers' read-modify-writes do not interleave.
+    """
+
+    slot = struct.Struct("<Q3d")
+
+    def __init__(self, name: str, slots: int):
+        from multiprocessing import resource_tracker, shared_memory
+
+        self.slots = slots
+        size = self.slot.size * slots
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), "a")
+        # under the lock, so that workers starting together agree on the segment
+        with self.locked():
+            try:
+                self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._memory = shared_memory.SharedMemory(name=name)
+                if self._memory.size != size:
+                    # pack_into would write past the end of a smaller one
+                    logger.warning(
+                        "Shared memory segment %s is %d bytes, not %d - replacing it.", name, self._memory.size, size
+                    )
+                    self._memory.unlink()
+                    self._memory.close()
+                    self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+            # otherwise the worker that created it unlinks it on exit, under the others
+            resource_tracker.unregister(self._memory._name, "shared_memory")  # noqa
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def get(self, key: str) -> Optional[State]:
+        key_hash = self._hash(key)
+        stored_hash, *state = self.slot.unpack_from(self._memory.buf, (key_hash % self.slots) * self.slot.size)
+        return tuple(state) if stored_hash == key_hash else None
+
+    def set(self, key: str, state: State) -> None:
+        key_hash = self._hash(key)
+        self.slot.pack_into(self._memory.buf, (key_hash % self.slots) * self.slot.size, key_hash, *state)
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        with self.locked():
+            self._memory.buf[:] = bytes(len(self._memory.buf))
+
+    def close(self) -> None:
+        self._lock_file.close()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Removes the segment - the workers still attached keep their mapping, but no longer share it."""
+        from multiprocessing import resource_tracker
+
+        # SharedMemory.unlink unregisters it again
+        resource_tracker.register(self._memory._name, "shared_memory")  # noqa
+        self._memory.unlink()
+
+
+class TokenBucket:
+    """capacity requests at once, refilled at rate per second. State: (tokens, updated_at, unused)."""
+
+    def __init__(self, store, capacity: float, rate: float):
+        self.store = store
+        self.capacity = capacity
+        self.rate = rate
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """Takes a token, returns 0 - or the seconds until one is available, taking nothing."""
+        now = time.monotonic() if now is None else now
+        with self.store.locked():
+            tokens, updated_at, _ = self.store.get(key) or (self.capacity, now, 0.0)
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self.store.set(key, (tokens, now, 0.0))
+                return (1 - tokens) / self.rate
+            self.store.set(key, (tokens - 1, now, 0.0))
+            return 0.0
+
+
+class SlidingWindow:
+    """
+    Sliding window counter: the previous fixed window's count, weighted by how much
+    of it still overlaps the sliding window, plus the current one's.
+    State: (window_start, count, previous_count).
+    """
+
+    def __init__(self, store, limit: int, window: float):
+        self.store = store
+        self.limit = limit
+        self.window = window
+
+    def _current(self, key: str, now: float) -> State:
+        window_start, count, previous = self.store.get(key) or (now, 0.0, 0.0)
+        elapsed_windows = int((now - window_start) // self.window)
+        if elapsed_windows == 1:
+            window_start, count, previous = window_start + self.window, 0.0, count
+        elif elapsed_windows > 1:
+            window_start, count, previous = now, 0.0, 0.0
+        return window_start, count, previous
+
+    def hit(self, key: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self.store.locked():
+            window_start, count, previous = self._current(key, now)
+            self.store.set(key, (window_start, count + 1, previous))
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """0 while under the limit, otherwise the seconds until the window has slid below it."""
+        now = time.monotonic() if now is None else now
+        window_start, count, previous = self._current(key, now)
+        elapsed = now - window_start
+        if previous * (1 - elapsed / self.window) + count < self.limit:
+            return 0.0
+
+        if count < self.limit:
+            # below the limit once enough of the previous window has slid out
+            return self.window * (1 - (self.limit - count) / previous) - elapsed
+        # in the next window, this one becomes the previous one
+        return (self.window - elapsed) + self.window * max(0.0, 1 - self.limit / count)
+
+
+class Throttle:
+    """
+    Every login and registration takes a token from its client IP's bucket. Failed
+    logins are counted per account and per IP; past the failure limits within the
+    window, logins for that account, or from that IP, are refused outright.
+
+    An account can be named by its username or its email. A failure is counted
+    under every name of the account, so whichever name the next attempt uses sees
+    all of them - alternating the two gains nothing.
+    """
+
+    def __init__(
+            self,
+            store,
+            enabled: bool,
+            ip_burst: int,
+            ip_rate: float,
+            failure_window: float,
+            account_failures: int,
+            ip_failures: int
+    ):
+        self.store = store
+        self.enabled = enabled
+        self.requests = TokenBucket(store, capacity=ip_burst, rate=ip_rate)
+        self.account_failures = SlidingWindow(store, limit=account_failures, window=failure_window)
+        self.ip_failures = SlidingWindow(store, limit=ip_failures, window=failure_window)
+        self.rejected = 0
+
+    def _reject_if_waiting(self, retry_after: float) -> None:
+        if retry_after > 0:
+            self.rejected += 1
+            raise TooManyRequestsException(retry_after)
+
+    def check_login(self, ip: str, account: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        if account:
+            self._reject_if_waiting(self.account_failures.retry_after(f"account-failures:{account.lower()}"))
+        self._reject_if_waiting(self.ip_failures.retry_after(f"ip-failures:{ip}"))
+        self._reject_if_waiting(self.requests.acquire(f"ip:{ip}"))
+
+    def check_register(self, ip: str) -> None:
+        if self.enabled:
+            self._reject_if_waiting(self.requests.acquire(f"ip:{ip}"))
+
+    def record_failure(self, ip: str, *accounts: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        for account in {account.lower() for account in accounts if account}:
+            self.account_failures.hit(f"account-failures:{account}")
+        self.ip_failures.hit(f"ip-failures:{ip}")
+
+    def stats(self) -> dict[str, int]:
+        return dict(rejected=self.rejected)
+
+
+def _create_store():
+    if settings.THROTTLE_SHARED_MEMORY_NAME:
+        return SharedMemoryStore(settings.THROTTLE_SHARED_MEMORY_NAME, slots=settings.THROTTLE_STORE_SIZE)
+    return MemoryStore(
+        maxsize=settings.THROTTLE_STORE_SIZE,
+        ttl=max(2 * settings.THROTTLE_FAILURE_WINDOW, settings.THROTTLE_IP_BURST / settings.THROTTLE_IP_RATE)
+    )
+
+
+throttle = Throttle(
+    store=_create_store(),
+    enabled=settings.THROTTLE_ENABLED,
+    ip_burst=settings.THROTTLE_IP_BURST,
+    ip_rate=settings.THROTTLE_IP_RATE,
+    failure_window=settings.THROTTLE_FAILURE_WINDOW,
+    account_failures=settings.THROTTLE_ACCOUNT_FAILURES,
+    ip_failures=settings.THROTTLE_IP_FAILURES
+)
+
+
+# route dependencies, declared ahead of the session ones - a refused request never checks out a connection
+async def throttle_login(request: Request, credentials: UserInLogin) -> None:
+    throttle.check_login(request.client.host, credentials.username or credentials.email)
+
+
+async def throttle_register(request: Request) -> None:
+    throttle.check_register(request.client.host)
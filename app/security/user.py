@@ -1,29 +1,36 @@
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.user import User
 from app.schemas.user import UserInLogin
-from app.security.password import verify_password
+from app.security.password import verify_and_update_password
 from app.utils.exceptions import InvalidCredentialsException
 
 
 async def verify_user(
         db_session: AsyncSession,
-        credentials: UserInLogin
+        credentials: UserInLogin,
+        write_session: Optional[AsyncSession] = None
 ) -> User:
 
+    # one SELECT - a missing user and a wrong password are reported the same way
     if credentials.username:
-        if not await User.is_taken(db_session, "username", credentials.username):
-            raise InvalidCredentialsException
-        user_db_data = await User.find_one(db_session, "username", credentials.username)
+        user_db_data = await User.find_one_or_none(db_session, "username", credentials.username)
     else:
-        if not await User.is_taken(db_session, "email", credentials.email):
-            raise InvalidCredentialsException
-        user_db_data = await User.find_one(db_session, "email", credentials.email)
-
-    if not await verify_password(
-            password_salt=user_db_data.password_salt,
-            hashed_password=user_db_data.hashed_password,
-            plain_password=credentials.password):
+        user_db_data = await User.find_one_or_none(db_session, "email", credentials.email)
+    if user_db_data is None:
         raise InvalidCredentialsException
 
+    verified, new_hashed_password = await verify_and_update_password(
+        password_salt=user_db_data.password_salt,
+        hashed_password=user_db_data.hashed_password,
+        plain_password=credentials.password
+    )
+    if not verified:
+        raise InvalidCredentialsException(accounts=(user_db_data.username, user_db_data.email))
+    if new_hashed_password:
+        # hashed with an outdated cost - roll PASSWORD_BCRYPT_ROUNDS out one login at a time
+        await user_db_data.update_password_hash(write_session or db_session, new_hashed_password)
+
     return user_db_data
@@ -1,5 +1,6 @@
 import os
 from functools import lru_cache
+from typing import Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseSettings, PostgresDsn
@@ -8,7 +9,9 @@ load_dotenv()
 
 
 class Settings(BaseSettings):
-    asyncpg_url: PostgresDsn = PostgresDsn.build(
+    # str rather than PostgresDsn: validating a host without a TLD, like "localhost",
+    # compiles pydantic's internationalized domain regex, most of the cost of Settings()
+    asyncpg_url: str = PostgresDsn.build(
         scheme="postgresql+asyncpg",
         user=os.getenv("SQL_USER"),
         password=os.getenv("SQL_PASS"),
@@ -16,14 +19,123 @@ class Settings(BaseSettings):
         port=os.getenv("SQL_PORT"),
         path=f"/{os.getenv('SQL_DB')}"
     )
+    # comma separated postgresql+asyncpg:// DSNs of read replicas
+    asyncpg_replica_urls: list[str] = [url for url in os.getenv("SQL_REPLICA_URLS", "").split(",") if url]
     asyncpg_url_for_tests = asyncpg_url.replace(os.getenv('SQL_DB'), os.getenv('SQL_TEST_DB'))
     url_for_tests = os.getenv('ALLOWED_HOST_2')
     allowed_hosts = [os.getenv('ALLOWED_HOST_1'), os.getenv('ALLOWED_HOST_2')]
 
+    DB_POOL_SIZE: int = os.getenv("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW: int = os.getenv("DB_MAX_OVERFLOW", 10)
+    DB_POOL_TIMEOUT: float = os.getenv("DB_POOL_TIMEOUT", 30.0)
+    # seconds, -1 keeps connections forever
+    DB_POOL_RECYCLE: int = os.getenv("DB_POOL_RECYCLE", -1)
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", False)
+    DB_STATEMENT_CACHE_SIZE: int = os.getenv("DB_STATEMENT_CACHE_SIZE", 100)
+    # checkouts waiting longer than this are logged
+    DB_SLOW_CHECKOUT_SECONDS: float = os.getenv("DB_SLOW_CHECKOUT_SECONDS", 0.1)
+    # reads of a user written by this worker go to the primary for this long
+    READ_YOUR_WRITES_SECONDS: float = os.getenv("READ_YOUR_WRITES_SECONDS", 5.0)
+    # a replica that could not be reached is skipped for this long, connecting to one gives up after the timeout
+    REPLICA_COOLDOWN_SECONDS: float = os.getenv("REPLICA_COOLDOWN_SECONDS", 10.0)
+    REPLICA_CONNECT_TIMEOUT: float = os.getenv("REPLICA_CONNECT_TIMEOUT", 1.0)
+
+    # comma separated usernames allowed to use the admin endpoints
+    admin_usernames: list[str] = [name for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name]
+
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ACCESS_TOKEN_EXPIRE_MINUTES: str = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
     ALGORITHM: str = os.getenv("ALGORITHM")
 
+    # bcrypt work factor, see python -m app.security.calibrate
+    PASSWORD_BCRYPT_ROUNDS: int = os.getenv("PASSWORD_BCRYPT_ROUNDS", 12)
+    # "process", "thread" or "inline"
+    PASSWORD_HASHING_BACKEND: str = os.getenv("PASSWORD_HASHING_BACKEND", "thread")
+    PASSWORD_HASHING_WORKERS: Optional[int] = os.getenv("PASSWORD_HASHING_WORKERS")
+    PASSWORD_HASHING_MAX_IN_FLIGHT: Optional[int] = os.getenv("PASSWORD_HASHING_MAX_IN_FLIGHT")
+    # slots bulk imports may take, the rest stay free for logins - half of max in flight by default
+    PASSWORD_HASHING_BULK_MAX_IN_FLIGHT: Optional[int] = os.getenv("PASSWORD_HASHING_BULK_MAX_IN_FLIGHT")
+
+    # buffer last_login_at updates instead of writing them during /auth/login
+    LAST_LOGIN_WRITE_BEHIND: bool = os.getenv("LAST_LOGIN_WRITE_BEHIND", False)
+    LAST_LOGIN_FLUSH_INTERVAL: float = os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 1.0)
+    LAST_LOGIN_BATCH_SIZE: int = os.getenv("LAST_LOGIN_BATCH_SIZE", 500)
+
+    PROFILE_CACHE_ENABLED: bool = os.getenv("PROFILE_CACHE_ENABLED", True)
+    PROFILE_CACHE_SIZE: int = os.getenv("PROFILE_CACHE_SIZE", 10_000)
+    PROFILE_CACHE_TTL: float = os.getenv("PROFILE_CACHE_TTL", 30.0)
+    PROFILE_CACHE_NEGATIVE_TTL: float = os.getenv("PROFILE_CACHE_NEGATIVE_TTL", 5.0)
+
+    TOKEN_CACHE_ENABLED: bool = os.getenv("TOKEN_CACHE_ENABLED", True)
+    TOKEN_CACHE_SIZE: int = os.getenv("TOKEN_CACHE_SIZE", 10_000)
+
+    USER_LIST_MAX_LIMIT: int = os.getenv("USER_LIST_MAX_LIMIT", 500)
+    # concurrent GET /users/{username} cache misses share queries: the same username one
+    # query, different ones arriving within USER_LOOKUP_BATCH_WINDOW seconds one = ANY query
+    USER_LOOKUP_COALESCING: bool = os.getenv("USER_LOOKUP_COALESCING", True)
+    # 0 still merges the lookups made in the same event loop iteration
+    USER_LOOKUP_BATCH_WINDOW: float = os.getenv("USER_LOOKUP_BATCH_WINDOW", 0.0)
+    USER_LOOKUP_MAX_BATCH_SIZE: int = os.getenv("USER_LOOKUP_MAX_BATCH_SIZE", 100)
+    # batch queries running at once, each holds a connection
+    USER_LOOKUP_MAX_IN_FLIGHT: int = os.getenv("USER_LOOKUP_MAX_IN_FLIGHT", 2)
+    # usernames per /users:batch request
+    USER_BATCH_MAX_SIZE: int = os.getenv("USER_BATCH_MAX_SIZE", 100)
+    # rows fetched per round trip by the user export
+    EXPORT_FETCH_SIZE: int = os.getenv("EXPORT_FETCH_SIZE", 1000)
+
+    # rows per INSERT in POST /users/bulk
+    BULK_IMPORT_CHUNK_SIZE: int = os.getenv("BULK_IMPORT_CHUNK_SIZE", 500)
+    BULK_IMPORT_MAX_LINE_BYTES: int = os.getenv("BULK_IMPORT_MAX_LINE_BYTES", 64 * 1024)
+    BULK_IMPORT_MAX_REPORTED_ERRORS: int = os.getenv("BULK_IMPORT_MAX_REPORTED_ERRORS", 1000)
+
+    # per-route request metrics and query accounting, served on /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", True)
+    # the scraper sends "Authorization: Bearer <METRICS_TOKEN>" - without it set, /metrics refuses every request
+    METRICS_TOKEN: Optional[str] = os.getenv("METRICS_TOKEN")
+
+    # /auth/login and /auth/register, per client IP: THROTTLE_IP_BURST at once, refilled at THROTTLE_IP_RATE/s
+    THROTTLE_ENABLED: bool = os.getenv("THROTTLE_ENABLED", True)
+    THROTTLE_IP_BURST: int = os.getenv("THROTTLE_IP_BURST", 20)
+    THROTTLE_IP_RATE: float = os.getenv("THROTTLE_IP_RATE", 1.0)
+    # failed logins allowed per account and per client IP within the window
+    THROTTLE_FAILURE_WINDOW: float = os.getenv("THROTTLE_FAILURE_WINDOW", 300.0)
+    THROTTLE_ACCOUNT_FAILURES: int = os.getenv("THROTTLE_ACCOUNT_FAILURES", 5)
+    THROTTLE_IP_FAILURES: int = os.getenv("THROTTLE_IP_FAILURES", 50)
+    # keys kept, per worker - or in total, for the shared memory store
+    THROTTLE_STORE_SIZE: int = os.getenv("THROTTLE_STORE_SIZE", 100_000)
+    # shares the throttling state between the workers on a host through this shared memory segment
+    THROTTLE_SHARED_MEMORY_NAME: Optional[str] = os.getenv("THROTTLE_SHARED_MEMORY_NAME")
+
+    # other workers' revocations are picked up within REVOCATION_SYNC_INTERVAL seconds
+    REVOCATION_SYNC_INTERVAL: float = os.getenv("REVOCATION_SYNC_INTERVAL", 1.0)
+    # revoked tokens and users the Bloom filter is sized for, more only raise its false positive rate
+    REVOCATION_BLOOM_CAPACITY: int = os.getenv("REVOCATION_BLOOM_CAPACITY", 100_000)
+    REVOCATION_BLOOM_ERROR_RATE: float = os.getenv("REVOCATION_BLOOM_ERROR_RATE", 0.001)
+    REVOCATION_CACHE_SIZE: int = os.getenv("REVOCATION_CACHE_SIZE", 10_000)
+
+    # every worker LISTENs on the channel for the cache keys other workers' writes made stale
+    INVALIDATION_BUS_ENABLED: bool = os.getenv("INVALIDATION_BUS_ENABLED", True)
+    INVALIDATION_RECONNECT_INTERVAL: float = os.getenv("INVALIDATION_RECONNECT_INTERVAL", 1.0)
+    # how quickly a silently dropped LISTEN connection is noticed
+    INVALIDATION_HEALTH_CHECK_INTERVAL: float = os.getenv("INVALIDATION_HEALTH_CHECK_INTERVAL", 5.0)
+
+    # /health/ready answers 503 until the warm-up after startup is done
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", True)
+    # pool connections opened by the warm-up, at most DB_POOL_SIZE
+    WARMUP_CONNECTIONS: int = os.getenv("WARMUP_CONNECTIONS", 5)
+    WARMUP_RETRY_INTERVAL: float = os.getenv("WARMUP_RETRY_INTERVAL", 5.0)
+    # orjson as the default response class, user responses serialized without response_model validation
+    FAST_JSON_RESPONSES: bool = os.getenv("FAST_JSON_RESPONSES", False)
+
+    SLOW_QUERY_LOG_ENABLED: bool = os.getenv("SLOW_QUERY_LOG_ENABLED", True)
+    SLOW_QUERY_THRESHOLD_SECONDS: float = os.getenv("SLOW_QUERY_THRESHOLD_SECONDS", 0.2)
+    # debug only - slow SELECTs are executed a second time under EXPLAIN ANALYZE
+    SLOW_QUERY_EXPLAIN: bool = os.getenv("SLOW_QUERY_EXPLAIN", False)
+    # rotating log file, the app.utils.slow_queries logger is left to the logging config when unset
+    SLOW_QUERY_LOG_FILE: Optional[str] = os.getenv("SLOW_QUERY_LOG_FILE")
+    SLOW_QUERY_LOG_MAX_BYTES: int = os.getenv("SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)
+    SLOW_QUERY_LOG_BACKUP_COUNT: int = os.getenv("SLOW_QUERY_LOG_BACKUP_COUNT", 5)
+
 
 @lru_cache
 def get_settings():
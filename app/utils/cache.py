@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: Optional[float]):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class LRUCache:
+    """
+    Bounded LRU cache whose entries expire after ttl seconds (per cache or per entry).
+
+    generation changes on every delete/clear - a reader that captured it before
+    loading a value can pass it to set() and the value is dropped if an
+    invalidation happened in the meantime.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = _Entry(value, None if ttl is None else time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return dict(
+            size=len(self._entries),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+        )
+
+
+class NullCache(LRUCache):
+    """Drop-in replacement used when a cache is disabled - stores nothing."""
+
+    def __init__(self):
+        super().__init__(maxsize=0)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, generation: Optional[int] = None) -> None:
+        return None
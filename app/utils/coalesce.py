@@ -0,0 +1,125 @@
+import abc
+import asyncio
+import time
+from typing import Any, Hashable, Optional
+
+from app.utils.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # a batch whose waiters were all cancelled must not log "exception was never retrieved"
+    if not future.cancelled():
+        future.exception()
+
+
+class BatchLoader(abc.ABC):
+    """
+    DataLoader-style coalescing of lookups by key. load(key) joins the lookup
+    already pending or in flight for the same key - single-flight - or queues the
+    key for the next batch. A batch is dispatched window seconds after its first
+    key, or as soon as it holds max_batch_size keys, and loaded with one
+    load_many() call. At most max_in_flight batches run at once; the others start
+    in the order they were dispatched, so no key waits behind later ones.
+
+    forget(key) must be called when key's data changes: a lookup already in
+    flight may have read it before the change, so later loads start a new one.
+    """
+
+    def __init__(self, enabled: bool, window: float, max_batch_size: int, max_in_flight: int):
+        self.enabled = enabled
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        # key -> result of its pending or running batch
+        self._futures: dict[Hashable, asyncio.Future] = {}
+        # the keys of the next batch, not looked up yet
+        self._batch: dict[Hashable, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self.loads = 0
+        self.shared = 0
+        self.batches = 0
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        # from load() to its result, the batch window included
+        self.wait = Histogram()
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            loads=self.loads,
+            shared=self.shared,
+            batches=self.batches,
+            pending=len(self._batch),
+            batch_sizes=self.batch_sizes.snapshot(),
+            wait_seconds=self.wait.snapshot(),
+        )
+
+    @abc.abstractmethod
+    async def load_many(self, keys: list[Hashable]) -> dict[Hashable, Any]:
+        """Results by key, a key left out gets None."""
+
+    def forget(self, key: Hashable) -> None:
+        # a key still waiting for its batch is read after the change anyway
+        if key not in self._batch:
+            self._futures.pop(key, None)
+
+    def forget_all(self) -> None:
+        self._futures = dict(self._batch)
+
+    async def load(self, key: Hashable) -> Any:
+        start = time.perf_counter()
+        self.loads += 1
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_retrieve_exception)
+            self._futures[key] = self._batch[key] = future
+            if len(self._batch) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+        else:
+            self.shared += 1
+
+        try:
+            # shielded - a cancelled caller must not cancel the lookup the others wait for
+            return await asyncio.shield(future)
+        finally:
+            self.wait.observe(time.perf_counter() - start)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict[Hashable, asyncio.Future]) -> None:
+        try:
+            async with self._slots:
+                self.batches += 1
+                self.batch_sizes.observe(len(batch))
+                results = await self.load_many(list(batch))
+        except asyncio.CancelledError:
+            for key, future in batch.items():
+                self._release(key, future)
+                future.cancel()
+            raise
+        except Exception as exc:
+            for key, future in batch.items():
+                self._release(key, future)
+                future.set_exception(exc)
+        else:
+            for key, future in batch.items():
+                self._release(key, future)
+                future.set_result(results.get(key))
+
+    def _release(self, key: Hashable, future: asyncio.Future) -> None:
+        # after forget(key) the entry may already belong to a newer lookup
+        if self._futures.get(key) is future:
+            del self._futures[key]
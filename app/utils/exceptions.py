@@ -1,10 +1,14 @@
+import math
+
 from fastapi import HTTPException, status
 
 
 class InvalidCredentialsException(HTTPException):
-    def __init__(self):
+    def __init__(self, accounts: tuple[str, ...] = ()):
         self.status_code = status.HTTP_403_FORBIDDEN
         self.detail = "Invalid credentials."
+        # username and email of the account when it exists - never part of the response
+        self.accounts = accounts
 
 
 class NotAuthorizedException(HTTPException):
@@ -13,3 +17,8 @@ class NotAuthorizedException(HTTPException):
         self.detail = "Not authorized to perform requested action."
 
 
+class TooManyRequestsException(HTTPException):
+    def __init__(self, retry_after: float):
+        self.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        self.detail = "Too many requests, try again later."
+        self.headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
@@ -0,0 +1,212 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram, buckets are inclusive upper bounds (seconds, unless counting something else)."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # the last slot counts values above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict[str, Any]:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        cumulative["+Inf"] = self.count
+        return dict(count=self.count, sum=self.sum, buckets=cumulative)
+
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class RequestStats:
+    """Database work done while serving one request, filled in by the engine events."""
+
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: Optional[Scope] = None):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# set by MetricsMiddleware for the duration of a request
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Metrics:
+    """In-process registry for the request, query and section metrics served on /metrics."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.in_flight = 0
+        self.requests: dict[tuple[str, str, int], int] = defaultdict(int)
+        self.latency: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.db_queries: dict[tuple[str, str], Histogram] = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.db_seconds: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.sections: dict[str, Histogram] = defaultdict(Histogram)
+        self.queries_outside_requests = 0
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        self.requests[(method, route, status_code)] += 1
+        self.latency[key].observe(seconds)
+        self.db_queries[key].observe(stats.queries)
+        self.db_seconds[key].observe(stats.db_seconds)
+
+    def observe_query(self, seconds: float) -> None:
+        stats = current_request.get()
+        if stats is None:
+            self.queries_outside_requests += 1
+            return
+        stats.queries += 1
+        stats.db_seconds += seconds
+
+    @contextmanager
+    def timed(self, section: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[section].observe(time.perf_counter() - start)
+
+
+metrics = Metrics()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels: Any) -> list[str]:
+    snapshot = histogram.snapshot()
+    lines = [f"{name}_bucket{_labels(**labels, le=bound)} {count}" for bound, count in snapshot["buckets"].items()]
+    lines.append(f"{name}_sum{_labels(**labels) if labels else ''} {snapshot['sum']}")
+    lines.append(f"{name}_count{_labels(**labels) if labels else ''} {snapshot['count']}")
+    return lines
+
+
+def histogram_family(name: str, help_text: str, histograms: dict, label_names: tuple[str, ...]) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, histogram in sorted(histograms.items()):
+        key = key if isinstance(key, tuple) else (key,)
+        lines.extend(_histogram_lines(name, histogram, **dict(zip(label_names, key))))
+    return lines
+
+
+def metric_family(name: str, kind: str, help_text: str, samples: dict, label_names: tuple[str, ...] = ()) -> list[str]:
+    """A gauge or counter; samples maps label values - () without labels - to the value."""
+
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for key, value in sorted(samples.items()):
+        key = key if isinstance(key, tuple) else (key,)
+        labels = _labels(**dict(zip(label_names, key))) if label_names else ""
+        lines.append(f"{name}{labels} {int(value) if isinstance(value, bool) else value}")
+    return lines
+
+
+def render_prometheus(registry: Metrics, extra: Iterable[str] = ()) -> str:
+    """The registry in the Prometheus text exposition format (version 0.0.4)."""
+
+    lines = [
+        "# HELP http_requests_in_flight Requests being served.",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {registry.in_flight}",
+        "# HELP http_requests_total Requests served, by route template and status code.",
+        "# TYPE http_requests_total counter",
+    ]
+    lines.extend(
+        f"http_requests_total{_labels(method=method, route=route, status=status_code)} {count}"
+        for (method, route, status_code), count in sorted(registry.requests.items())
+    )
+    lines.extend(histogram_family(
+        "http_request_duration_seconds", "Time to serve a request.", registry.latency, ("method", "route")
+    ))
+    lines.extend(histogram_family(
+        "http_request_db_queries", "Statements executed per request.", registry.db_queries, ("method", "route")
+    ))
+    lines.extend(histogram_family(
+        "http_request_db_seconds", "Time spent executing statements per request.", registry.db_seconds,
+        ("method", "route")
+    ))
+    lines.extend(histogram_family(
+        "section_duration_seconds", "Time spent in bcrypt and JWT sections.", registry.sections, ("section",)
+    ))
+    lines.extend([
+        "# HELP db_queries_outside_requests_total Statements executed outside of a request.",
+        "# TYPE db_queries_outside_requests_total counter",
+        f"db_queries_outside_requests_total {registry.queries_outside_requests}",
+    ])
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status code and database work per route.
+    Routes are labelled with their path template, so /users/{username} is one series;
+    requests that match no route share the "unmatched" label.
+    """
+
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+        self._routes: Optional[dict[Callable, str]] = None
+
+    def _route(self, scope: Scope) -> str:
+        if self._routes is None:
+            # routes are all registered by the time the first request comes in
+            self._routes = {
+                route.endpoint: route.path
+                for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.registry.in_flight -= 1
+            current_request.reset(token)
+            self.registry.observe_request(scope["method"], self._route(scope), status_code, elapsed, stats)
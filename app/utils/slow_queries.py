@@ -0,0 +1,106 @@
+import logging
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.utils.metrics import current_request
+
+logger = logging.getLogger(__name__)
+
+
+def parameters_shape(parameters: Any) -> Any:
+    """Parameter types without their values - they can hold password hashes and emails."""
+
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return f"{len(parameters)} x {parameters_shape(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def current_endpoint() -> Optional[str]:
+    """The request being served, as recorded by MetricsMiddleware."""
+
+    stats = current_request.get()
+    if stats is None or stats.scope is None:
+        return None
+    endpoint = stats.scope.get("endpoint")
+    name = f"{endpoint.__module__}.{endpoint.__qualname__}" if endpoint else "unmatched"
+    return f"{stats.scope['method']} {stats.scope['path']} ({name})"
+
+
+class SlowQueryLog:
+    """
+    Logs statements taking longer than threshold_seconds on the instrumented engines,
+    with the shape of their parameters and the endpoint that ran them.
+
+    With explain, slow SELECTs are run again as EXPLAIN (ANALYZE, BUFFERS) on a separate
+    cursor of the same connection, inside a savepoint, and the plan is logged too.
+    Statements of server-side cursors are not explained - the cursor is still open.
+    Plans show the bound values in their filters, so keep explain to debugging.
+    """
+
+    def __init__(self, threshold_seconds: float, explain: bool = False):
+        self.threshold_seconds = threshold_seconds
+        self.explain = explain
+        self.logged = 0
+
+    def configure_file(self, path: str, max_bytes: int, backup_count: int) -> None:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+
+    def instrument(self, db_engine: AsyncEngine) -> None:
+        event.listen(db_engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(db_engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # noqa
+        context.slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):  # noqa
+        duration = time.perf_counter() - context.slow_query_start
+        if duration < self.threshold_seconds:
+            return
+
+        self.logged += 1
+        message = "Slow query: %.3fs endpoint=%s parameters=%s\n%s"
+        args = [duration, current_endpoint(), parameters_shape(parameters), statement]
+        if self.explain and self._explainable(statement, context):
+            message += "\n%s"
+            args.append(self._explain(conn, statement, parameters))
+        logger.warning(message, *args)
+
+    @staticmethod
+    def _explainable(statement: str, context) -> bool:
+        return (
+            statement.lstrip().upper().startswith("SELECT")
+            and not context._is_server_side
+            and context.execution_options.get("isolation_level") != "AUTOCOMMIT"
+        )
+
+    @staticmethod
+    def _explain(conn, statement: str, parameters: Any) -> str:
+        # ANALYZE runs the statement again; the savepoint keeps a failure from
+        # aborting the transaction the statement belongs to
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            except Exception as exc:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                plan = f"EXPLAIN failed: {exc!r}"
+        except Exception as exc:
+            plan = f"EXPLAIN failed: {exc!r}"
+        finally:
+            cursor.close()
+        return plan
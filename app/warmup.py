@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.database import async_session, read_router
+from app.models.user import User
+from app.security.jwt import create_access_token_for_user, decode_token
+from app.security.password import generate_salt, get_password_hash, password_hasher, verify_password
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Pays the first-request costs in the background after startup: opens
+    `connections` pool connections and prepares the login and registration
+    lookups on each of them, then spins up the password hashing workers and
+    signs and decodes a token. ready stays False until that succeeded once;
+    failed attempts are retried every retry_interval seconds.
+    """
+
+    def __init__(
+            self,
+            session_factory: async_sessionmaker[AsyncSession],
+            replicas: list[async_sessionmaker[AsyncSession]],
+            enabled: bool,
+            connections: int,
+            retry_interval: float
+    ):
+        self.session_factory = session_factory
+        self.replicas = replicas
+        self.enabled = enabled
+        self.connections = connections
+        self.retry_interval = retry_interval
+        # with warm-up disabled there is nothing to wait for
+        self.ready = not enabled
+        self.attempts = 0
+        self.steps: dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> dict[str, Any]:
+        return dict(ready=self.ready, attempts=self.attempts, step_seconds=self.steps)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run_until_ready())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_until_ready(self) -> None:
+        while True:
+            try:
+                await self.run()
+                return
+            except Exception:
+                logger.warning("Warm-up failed, retrying in %.1fs.", self.retry_interval, exc_info=True)
+                await asyncio.sleep(self.retry_interval)
+
+    async def run(self) -> None:
+        self.attempts += 1
+        await self._timed("primary", self._warm_pool(self.session_factory))
+        for i, replica in enumerate(self.replicas):
+            await self._timed(f"replica_{i}", self._warm_pool(replica))
+        await self._timed("password_hashing", self._warm_password_hashing())
+        await self._timed("jwt", self._warm_jwt())
+        self.ready = True
+
+    async def _timed(self, step: str, coroutine) -> None:
+        start = time.perf_counter()
+        await coroutine
+        self.steps[step] = time.perf_counter() - start
+
+    async def _warm_pool(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        # the sessions are held until all of them ran, so each one gets its own connection
+        sessions = [session_factory() for _ in range(self.connections)]
+        try:
+            await asyncio.gather(*(self._prepare_statements(db_session) for db_session in sessions))
+        finally:
+            await asyncio.gather(*(db_session.close() for db_session in sessions))
+
+    @staticmethod
+    async def _prepare_statements(db_session: AsyncSession) -> None:
+        # asyncpg keeps the prepared statements and type introspection per connection
+        for attr_name in ("username", "email"):
+            await User.find_one_or_none(db_session, attr_name, "")
+            await User.is_taken(db_session, attr_name, "")
+
+    @staticmethod
+    async def _warm_password_hashing() -> None:
+        # one hash per worker, so a process pool has all of its workers started
+        workers = password_hasher.workers if password_hasher.backend == "process" else 1
+        salt = await generate_salt()
+        hashes = await asyncio.gather(*(get_password_hash(salt, "warm-up") for _ in range(workers)))
+        await verify_password(salt, "warm-up", hashes[0])
+
+    @staticmethod
+    async def _warm_jwt() -> None:
+        await decode_token(await create_access_token_for_user("warm-up"))
+
+
+warm_up = WarmUp(
+    session_factory=async_session,
+    # filled in by get_engine()
+    replicas=read_router.replicas,
+    enabled=settings.WARMUP_ENABLED,
+    # more than the pool keeps would be closed again on return
+    connections=min(settings.WARMUP_CONNECTIONS, settings.DB_POOL_SIZE),
+    retry_interval=settings.WARMUP_RETRY_INTERVAL
+)
@@ -0,0 +1,70 @@
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Sequence
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: Sequence[float]) -> dict[str, float]:
+    ordered = sorted(values)
+    return dict(
+        mean=statistics.fmean(ordered) if ordered else 0.0,
+        stdev=statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        p50=percentile(ordered, 0.50),
+        p95=percentile(ordered, 0.95),
+        p99=percentile(ordered, 0.99),
+    )
+
+
+def save(path: str, results: dict[str, dict[str, float]], **meta: Any) -> None:
+    meta.update(
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        created_at=datetime.now(timezone.utc).isoformat(),
+    )
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(dict(meta=meta, results=results), indent=2) + "\n")
+
+
+def load(path: str) -> dict[str, dict[str, float]]:
+    return json.loads(Path(path).read_text())["results"]
+
+
+def compare(
+        current: dict[str, dict[str, float]],
+        baseline: dict[str, dict[str, float]],
+        threshold: float,
+        lower_is_better: Sequence[str] = (),
+        higher_is_better: Sequence[str] = ()
+) -> list[str]:
+    """Describes every metric that got worse than the baseline by more than threshold (0.1 = 10%)."""
+    regressions = []
+    for name, old in baseline.items():
+        new = current.get(name)
+        if new is None:
+            continue
+        for metric in lower_is_better:
+            if metric in old and new[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {old[metric]:.4g} -> {new[metric]:.4g}")
+        for metric in higher_is_better:
+            if metric in old and new[metric] < old[metric] * (1 - threshold):
+                regressions.append(f"{name} {metric}: {old[metric]:.4g} -> {new[metric]:.4g}")
+    return regressions
+
+
+def report(results: dict[str, dict[str, float]], columns: Sequence[str]) -> str:
+    width = max(len(name) for name in results) if results else 0
+    lines = [f"{'':{width}}  " + "  ".join(f"{column:>12}" for column in columns)]
+    for name, values in results.items():
+        lines.append(f"{name:{width}}  " + "  ".join(f"{values[column]:>12.4g}" for column in columns))
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+"""
+Rendering a page of N authors: N concurrent GET /users/{username} requests
+against one GET /users:batch, in process against a local Postgres.
+
+--users rows are seeded once, then --pages pages of --page-size random
+usernames are fetched both ways, --concurrency pages at once. Reported per
+strategy: pages/s, page latency p50/p95/p99 in milliseconds and queries per
+page. The profile cache is cleared before every page unless --warm is given,
+so both strategies pay for their queries.
+
+    python -m benchmarks.batch --page-size 20 --save benchmarks/results/batch.json
+    python -m benchmarks.batch --page-size 20 --compare benchmarks/results/batch.json
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from httpx import AsyncClient
+from sqlalchemy import delete, event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import create_db_engine, get_db
+from app.main import get_app
+from app.models.base import Base
+from app.models.user import User, profile_cache, profile_loader
+from app.settings import settings
+from benchmarks import baseline
+
+
+async def fetch_one_by_one(client: AsyncClient, usernames: list[str]) -> None:
+    responses = await asyncio.gather(*(client.get(f"/users/{username}") for username in usernames))
+    assert all(response.status_code == 200 for response in responses)
+
+
+async def fetch_batch(client: AsyncClient, usernames: list[str]) -> None:
+    response = await client.get("/users:batch", params=dict(usernames=",".join(usernames)))
+    assert response.status_code == 200 and not response.json()["missing"]
+
+
+STRATEGIES = {
+    "GET /users/{username} x N": fetch_one_by_one,
+    "GET /users:batch": fetch_batch,
+}
+
+
+async def run(
+        database_url: str,
+        users: int,
+        pages: int,
+        page_size: int,
+        concurrency: int,
+        warm: bool
+) -> dict[str, dict[str, float]]:
+    engine = create_db_engine(database_url)
+    session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    prefix = f"batch-{uuid.uuid4().hex[:8]}"
+    usernames = [f"{prefix}-{i}" for i in range(users)]
+    async with engine.begin() as conn:
+        # no passwords are checked, the hashing is skipped
+        await conn.execute(insert(User.__table__), [
+            dict(username=username, email=f"{username}@bench.example.com", hashed_password="-", password_salt="-")
+            for username in usernames
+        ])
+
+    queries = 0
+
+    def count_query(*args):  # noqa
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+
+    async def get_db_for_benchmark():
+        db = session()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    application = get_app()
+    application.dependency_overrides[get_db] = get_db_for_benchmark
+    profile_loader.session_factory = session
+    rng = random.Random(0)
+    page_usernames = [rng.sample(usernames, page_size) for _ in range(pages)]
+    results = {}
+
+    async with AsyncClient(app=application, base_url="http://benchmark") as client:
+        for name, fetch in STRATEGIES.items():
+            latencies = []
+            queue = list(reversed(page_usernames))
+
+            async def worker() -> None:
+                while queue:
+                    page = queue.pop()
+                    if not warm:
+                        profile_cache.clear()
+                    start = time.perf_counter()
+                    await fetch(client, page)
+                    latencies.append(time.perf_counter() - start)
+
+            queries = 0
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+            summary = baseline.summarize([latency * 1000 for latency in latencies])
+            results[name] = dict(
+                pages_per_sec=pages / elapsed,
+                p50_ms=summary["p50"],
+                p95_ms=summary["p95"],
+                p99_ms=summary["p99"],
+                queries_per_page=queries / pages,
+            )
+
+    event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+    async with engine.begin() as conn:
+        await conn.execute(delete(User).where(User.username.startswith(prefix)))
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.asyncpg_url_for_tests)
+    parser.add_argument("--users", type=int, default=1000, help="users seeded")
+    parser.add_argument("--pages", type=int, default=200, help="pages fetched per strategy")
+    parser.add_argument("--page-size", type=int, default=20, help="authors per page")
+    parser.add_argument("--concurrency", type=int, default=10, help="pages fetched at once")
+    parser.add_argument("--warm", action="store_true", help="keep the profile cache between pages")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.database_url, args.users, args.pages, args.page_size, args.concurrency, args.warm))
+    print(baseline.report(results, ("pages_per_sec", "p50_ms", "p95_ms", "p99_ms", "queries_per_page")))
+
+    if args.save:
+        baseline.save(
+            args.save, results,
+            users=args.users, pages=args.pages, page_size=args.page_size, concurrency=args.concurrency, warm=args.warm
+        )
+    if args.compare:
+        regressions = baseline.compare(
+            results,
+            baseline.load(args.compare),
+            args.threshold,
+            lower_is_better=("p50_ms", "p95_ms", "p99_ms", "queries_per_page"),
+            higher_is_better=("pages_per_sec",)
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
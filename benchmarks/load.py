@@ -0,0 +1,139 @@
+"""
+In-process load test of app.main.get_app() against a local Postgres.
+
+Each virtual user registers, logs in, reads its profile a few times, patches
+it and deletes itself; --concurrency of them run at once. Latency is reported
+per route as RPS and p50/p95/p99 in milliseconds.
+
+    python -m benchmarks.load --users 500 --concurrency 50 --save benchmarks/results/load.json
+    python -m benchmarks.load --users 500 --concurrency 50 --compare benchmarks/results/load.json
+
+bcrypt dominates register and login - set PASSWORD_BCRYPT_ROUNDS to the
+production cost for realistic numbers, or lower it to look at the rest.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+
+from httpx import AsyncClient
+
+from app.database import async_session, create_db_engine, read_router
+from app.invalidation import invalidation_bus
+from app.main import get_app
+from app.models.base import Base
+from app.security.throttle import throttle
+from app.settings import settings
+from benchmarks import baseline
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def request(self, client: AsyncClient, route: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.is_error:
+            self.errors[route] += 1
+        return response
+
+    def results(self, elapsed: float) -> dict[str, dict[str, float]]:
+        results = {}
+        for route, latencies in sorted(self.latencies.items()):
+            summary = baseline.summarize([latency * 1000 for latency in latencies])
+            results[route] = dict(
+                count=len(latencies),
+                errors=self.errors[route],
+                rps=len(latencies) / elapsed,
+                p50_ms=summary["p50"],
+                p95_ms=summary["p95"],
+                p99_ms=summary["p99"],
+            )
+        return results
+
+
+async def virtual_user(client: AsyncClient, recorder: Recorder, username: str, reads: int) -> None:
+    credentials = dict(username=username, email=f"{username}@bench.example.com", password="benchmark")
+
+    await recorder.request(client, "POST /auth/register", "POST", "/auth/register", json=credentials)
+    response = await recorder.request(client, "POST /auth/login", "POST", "/auth/login", json=credentials)
+    headers = dict(token=response.json().get("token", ""))
+    for _ in range(reads):
+        await recorder.request(client, "GET /users/{username}", "GET", f"/users/{username}")
+    await recorder.request(
+        client, "PATCH /users/{username}", "PATCH", f"/users/{username}",
+        json=dict(bio="benchmark"), headers=headers
+    )
+    await recorder.request(client, "DELETE /users/{username}", "DELETE", f"/users/{username}", headers=headers)
+
+
+async def run(database_url: str, users: int, concurrency: int, reads: int) -> tuple[dict, float]:
+    engine = create_db_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    application = get_app()
+    # the requests and everything the lifespan starts - warm-up, the revocation sync, the
+    # last_login flusher, the profile loader - share async_session, so they all use --database-url
+    async_session.configure(bind=engine)
+    read_router.replicas.clear()
+    invalidation_bus.dsn = database_url
+    # every virtual user comes from the same client address
+    throttle.enabled = False
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(users):
+        queue.put_nowait(i)
+
+    async def worker(client: AsyncClient) -> None:
+        while not queue.empty():
+            await virtual_user(client, recorder, f"bench-{run_id}-{queue.get_nowait()}", reads)
+
+    async with application.router.lifespan_context(application):
+        async with AsyncClient(app=application, base_url="http://benchmark") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+    await engine.dispose()
+    return recorder.results(elapsed), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.asyncpg_url_for_tests)
+    parser.add_argument("--users", type=int, default=200, help="virtual users in total")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users running at once")
+    parser.add_argument("--reads", type=int, default=5, help="profile reads per virtual user")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run(args.database_url, args.users, args.concurrency, args.reads))
+    print(baseline.report(results, ("count", "errors", "rps", "p50_ms", "p95_ms", "p99_ms")))
+    print(f"\n{sum(route['count'] for route in results.values()) / elapsed:.1f} requests/s overall")
+
+    if args.save:
+        baseline.save(args.save, results, users=args.users, concurrency=args.concurrency, reads=args.reads)
+    if args.compare:
+        regressions = baseline.compare(
+            results,
+            baseline.load(args.compare),
+            args.threshold,
+            lower_is_better=("p50_ms", "p95_ms", "p99_ms", "errors"),
+            higher_is_better=("rps",)
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
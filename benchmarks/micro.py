@@ -0,0 +1,188 @@
+"""
+Microbenchmarks of the per-request CPU hot spots: bcrypt, JWT and the pydantic
+schemas built from ORM instances. No database is needed.
+
+    python -m benchmarks.micro --save benchmarks/results/micro.json
+    python -m benchmarks.micro --compare benchmarks/results/micro.json --filter jwt
+
+For every case: ops/sec over --repeats rounds (mean and coefficient of
+variation), the peak memory traced while one round runs and the memory blocks
+still allocated per op afterwards.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import select
+
+from app.models.user import User
+from app.schemas import serializers
+from app.schemas.user import UserInDB, UserPublic, UserWithToken
+from app.security import jwt as jwt_module
+from app.security.jwt import create_access_token_for_user, decode_token
+from app.security.password import get_password_hash, password_hasher, verify_password
+from app.utils.cache import NullCache
+from benchmarks import baseline
+
+Case = Callable[[], Awaitable[Any]]
+
+
+def _user() -> User:
+    now = datetime.now(timezone.utc)
+    return User(
+        id=1,
+        username="benchmark",
+        email="benchmark@example.com",
+        bio="Writes benchmarks.",
+        image="https://img.example.com/benchmark.png",
+        hashed_password="$2b$12$" + "x" * 53,
+        password_salt="$2b$12$" + "y" * 22,
+        created_at=now,
+        last_login_at=now,
+    )
+
+
+async def build_cases() -> dict[str, tuple[Case, int]]:
+    """name -> (coroutine function running one op, ops per round)"""
+    user = _user()
+    salt = "$2b$12$abcdefghijklmnopqrstuv"
+    hashed_password = await get_password_hash(password_salt=salt, plain_password="benchmark")
+    token = await create_access_token_for_user("benchmark")
+
+    async def decode_token_uncached():
+        cache, jwt_module.token_cache = jwt_module.token_cache, NullCache()
+        try:
+            return await decode_token(token)
+        finally:
+            jwt_module.token_cache = cache
+
+    async def user_public_from_orm():
+        return UserPublic.from_orm(user)
+
+    async def user_public_json():
+        return UserPublic.from_orm(user).json()
+
+    async def user_in_db_json():
+        return UserInDB.from_orm(user).json()
+
+    async def user_with_token_json():
+        return UserWithToken(user=user, token=token).json()
+
+    # statement construction plus the cache key SQLAlchemy computes on every execute
+    async def lookup_statement_rebuilt():
+        return select(User).where(User.username == "benchmark")._generate_cache_key()
+
+    async def lookup_statement_cached():
+        return User.lookup_statement("username")._generate_cache_key()
+
+    # what FastAPI does with a route's return value: response_model validation, then JSONResponse
+    user_public_field = create_response_field(name="response", type_=UserPublic)
+    user_with_token_field = create_response_field(name="response", type_=UserWithToken)
+
+    async def user_public_response():
+        return JSONResponse(await serialize_response(field=user_public_field, response_content=user)).body
+
+    async def user_with_token_response():
+        content = UserWithToken(user=user, token=token)
+        return JSONResponse(await serialize_response(field=user_with_token_field, response_content=content)).body
+
+    async def user_public_response_fast():
+        return serializers.RawJSONResponse(serializers.user_public_json(user)).body
+
+    async def user_with_token_response_fast():
+        return serializers.RawJSONResponse(serializers.user_with_token_json(user, token)).body
+
+    return {
+        "password.get_password_hash": (lambda: get_password_hash(password_salt=salt, plain_password="benchmark"), 3),
+        "password.verify_password": (
+            lambda: verify_password(password_salt=salt, plain_password="benchmark", hashed_password=hashed_password),
+            3
+        ),
+        "jwt.create_access_token_for_user": (lambda: create_access_token_for_user("benchmark"), 2000),
+        "jwt.decode_token": (decode_token_uncached, 2000),
+        "jwt.decode_token (cached)": (lambda: decode_token(token), 2000),
+        "schemas.UserPublic.from_orm": (user_public_from_orm, 2000),
+        "schemas.UserPublic.json": (user_public_json, 2000),
+        "schemas.UserInDB.json": (user_in_db_json, 2000),
+        "schemas.UserWithToken.json": (user_with_token_json, 2000),
+        "models.lookup_statement (rebuilt)": (lookup_statement_rebuilt, 2000),
+        "models.lookup_statement (cached)": (lookup_statement_cached, 2000),
+        "response.UserPublic": (user_public_response, 2000),
+        "response.UserPublic (fast)": (user_public_response_fast, 2000),
+        "response.UserWithToken": (user_with_token_response, 2000),
+        "response.UserWithToken (fast)": (user_with_token_response_fast, 2000),
+    }
+
+
+async def measure(case: Case, number: int, repeats: int) -> dict[str, float]:
+    for _ in range(max(1, number // 10)):
+        await case()
+
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            await case()
+        rates.append(number / (time.perf_counter() - start))
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(number):
+        await case()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    mean = statistics.fmean(rates)
+    return dict(
+        ops_per_sec=mean,
+        cv=statistics.stdev(rates) / mean if len(rates) > 1 else 0.0,
+        peak_kib=peak / 1024,
+        retained_blocks_per_op=retained_blocks / number,
+    )
+
+
+async def run(repeats: int, name_filter: str) -> dict[str, dict[str, float]]:
+    # measure bcrypt itself, not the hand-off to a pool
+    password_hasher.configure(backend="inline")
+    results = {}
+    for name, (case, number) in (await build_cases()).items():
+        if name_filter in name:
+            results[name] = await measure(case, number, repeats)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeats, args.filter))
+    print(baseline.report(results, ("ops_per_sec", "cv", "peak_kib", "retained_blocks_per_op")))
+
+    if args.save:
+        baseline.save(args.save, results, repeats=args.repeats)
+    if args.compare:
+        regressions = baseline.compare(
+            results, baseline.load(args.compare), args.threshold, higher_is_better=("ops_per_sec",)
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cold-start profile of a worker: every run is a fresh interpreter that imports
+app.main and then builds the application with get_app(), which is what
+"uvicorn app.main:app" does before it accepts traffic.
+
+    python -m benchmarks.startup --save benchmarks/results/startup.json
+    python -m benchmarks.startup --compare benchmarks/results/startup.json
+
+Reports the median wall time of both steps, then a -X importtime breakdown:
+self time summed per top-level package, and which of the slow optional
+imports are already loaded after each step.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from benchmarks import baseline
+
+# loaded lazily by the app, listed to catch an eager import sneaking back in
+WATCHED_MODULES = ("passlib", "bcrypt", "jose", "asyncpg", "email_validator", "multiprocessing", "orjson")
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+loaded_after_import = [name for name in {WATCHED_MODULES!r} if name in sys.modules]
+app.main.get_app()
+built = time.perf_counter()
+loaded_after_get_app = [name for name in {WATCHED_MODULES!r} if name in sys.modules]
+print(json.dumps(dict(
+    import_seconds=imported - start,
+    get_app_seconds=built - imported,
+    loaded_after_import=loaded_after_import,
+    loaded_after_get_app=loaded_after_get_app,
+)))
+"""
+
+
+def probe(*python_options: str) -> tuple[dict, str]:
+    completed = subprocess.run(
+        [sys.executable, *python_options, "-c", PROBE],
+        capture_output=True, text=True, check=True, env=os.environ.copy()
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def import_breakdown(importtime_output: str) -> dict[str, float]:
+    """Milliseconds of import self time per top-level package, from -X importtime output."""
+    self_ms: dict[str, float] = defaultdict(float)
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, module = line[len("import time:"):].split("|")
+        self_ms[module.strip().split(".")[0]] += int(self_us) / 1000
+    return dict(sorted(self_ms.items(), key=lambda item: item[1], reverse=True))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="packages shown in the breakdown")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    runs = [probe()[0] for _ in range(args.runs)]
+    results = {
+        step: dict(
+            median_ms=statistics.median(run[f"{step}_seconds"] for run in runs) * 1000,
+            stdev_ms=statistics.stdev(run[f"{step}_seconds"] for run in runs) * 1000 if len(runs) > 1 else 0.0,
+        )
+        for step in ("import", "get_app")
+    }
+    results["total"] = dict(
+        median_ms=statistics.median(run["import_seconds"] + run["get_app_seconds"] for run in runs) * 1000,
+        stdev_ms=0.0,
+    )
+    print(baseline.report(results, ("median_ms", "stdev_ms")))
+
+    profile, importtime_output = probe("-X", "importtime")
+    breakdown = import_breakdown(importtime_output)
+    print("\nimport self time by package (ms):")
+    print(baseline.report(
+        {package: dict(self_ms=ms) for package, ms in list(breakdown.items())[:args.top]}, ("self_ms",)
+    ))
+    print(f"\nloaded after import app.main: {', '.join(profile['loaded_after_import']) or '-'}")
+    print(f"loaded after get_app():       {', '.join(profile['loaded_after_get_app']) or '-'}")
+
+    if args.save:
+        baseline.save(args.save, results, runs=args.runs, import_breakdown_ms=breakdown)
+    if args.compare:
+        regressions = baseline.compare(
+            results, baseline.load(args.compare), args.threshold, lower_is_better=("median_ms",)
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
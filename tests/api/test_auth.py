@@ -2,10 +2,13 @@ from datetime import datetime, timezone, timedelta
 
 import pytest
 from httpx import AsyncClient
+from passlib.context import CryptContext
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.user import User
 from app.schemas.user import UserInDBForTests
+from app.security import password
 from app.security.jwt import decode_token
 from app.security.password import verify_password
 
@@ -45,3 +48,44 @@ async def test_login_user(client: AsyncClient, test_db: AsyncSession, test_user_
     assert all(key in user_data["user"] for key in
                ["id", "username", "email", "bio", "image", "created_at", "last_login_at"]
                )
+
+
+async def test_login_user_query_count(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        query_counter: list[str]
+):
+    await User.create(test_db, **test_user_credentials)
+    query_counter.clear()
+
+    response = await client.post("/auth/login", json=test_user_credentials)
+    assert response.status_code == 202
+    selects = [stmt for stmt in query_counter if stmt.lstrip().upper().startswith("SELECT")]
+    writes = [stmt for stmt in query_counter if stmt not in selects]
+    assert len(selects) == 1
+    assert len(writes) <= 1
+
+
+async def test_login_user_rehash(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        monkeypatch
+):
+    monkeypatch.setattr(password, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    user = await User.create(test_db, **test_user_credentials)
+    assert user.hashed_password.startswith("$2b$04$")
+
+    monkeypatch.setattr(password, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    response = await client.post("/auth/login", json=test_user_credentials)
+    assert response.status_code == 202
+
+    stmt = select(User.hashed_password).where(User.id == user.id)
+    hashed_password = await test_db.scalar(stmt)
+    assert hashed_password.startswith("$2b$05$")
+    assert await verify_password(
+        password_salt=user.password_salt,
+        plain_password=test_user_credentials["password"],
+        hashed_password=hashed_password
+    )
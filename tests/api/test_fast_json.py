@@ -0,0 +1,55 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.security.jwt import create_access_token_for_user
+from app.settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+
+async def get_both(client: AsyncClient, monkeypatch, method: str, url: str, **kwargs):
+    responses = []
+    for fast in (False, True):
+        monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", fast)
+        responses.append(await client.request(method, url, **kwargs))
+    return responses
+
+
+async def test_same_responses(client: AsyncClient, test_db: AsyncSession, monkeypatch):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    admin_token = await create_access_token_for_user("admin")
+    user = await User.create(test_db, username="test", email="test@email.com", password="test")
+    await user.update(test_db, bio="Bio", image="http://img.myimage.jpg")
+    token = await create_access_token_for_user("test")
+
+    requests = (
+        ("GET", "/users/test", {}),
+        ("GET", "/users", dict(headers=dict(token=admin_token), params=dict(limit=1))),
+        ("PATCH", "/users/test", dict(headers=dict(token=token), json=dict(bio="Updated bio"))),
+        ("GET", "/users:batch", dict(params=dict(usernames="test,nobody"))),
+    )
+    for method, url, kwargs in requests:
+        regular, fast = await get_both(client, monkeypatch, method, url, **kwargs)
+        assert regular.status_code == fast.status_code == 200
+        assert regular.headers["content-type"] == fast.headers["content-type"]
+        assert regular.content == fast.content
+
+
+async def test_auth_responses(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+    credentials = dict(username="test", email="test@email.com", password="test")
+
+    response = await client.post("/auth/register", json=credentials)
+    assert response.status_code == 201
+    assert list(response.json()) == ["username", "bio", "image", "created_at", "last_login_at"]
+
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", False)
+    regular = await client.post("/auth/login", json=credentials)
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+    fast = await client.post("/auth/login", json=credentials)
+    assert regular.status_code == fast.status_code == 202
+    assert list(regular.json()) == list(fast.json()) == ["token", "user"]
+    assert regular.json()["user"].keys() == fast.json()["user"].keys()
+    assert regular.json()["user"]["created_at"] == fast.json()["user"]["created_at"]
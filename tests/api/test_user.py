@@ -1,12 +1,20 @@
+import asyncio
+import csv
+import io
+import json
+
 import pytest
 from fastapi import HTTPException
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.user import User
-from app.schemas.user import UserInDBForTests
+from app.database import read_router
+from app.models.user import User, profile_loader
+from app.schemas.user import UserInDBForTests, UserPublic
 from app.security.password import verify_password
 from app.security.jwt import create_access_token_for_user
+from app.settings import settings
+from tests.overwritten_db import async_session_for_testing
 
 pytestmark = pytest.mark.asyncio
 
@@ -23,6 +31,80 @@ async def test_get_user(client: AsyncClient, test_db: AsyncSession, test_user_cr
     assert all(key not in user_data for key in ["password", "hashed_password", "password_salt"])
 
 
+async def test_get_users_batch(client: AsyncClient, test_db: AsyncSession, query_counter: list[str]):
+    for username in ("ann", "bob", "cid"):
+        await User.create(test_db, username=username, email=f"{username}@email.com", password="test")
+    query_counter.clear()
+
+    response = await client.get("/users:batch", params=dict(usernames="bob,nobody,ann,bob"))
+    assert response.status_code == 200
+    batch = response.json()
+    assert list(batch["users"]) == ["bob", "ann"]
+    assert batch["users"]["ann"]["username"] == "ann"
+    assert batch["missing"] == ["nobody"]
+    assert len(query_counter) == 1
+    assert "ANY" in query_counter[0]
+
+    # ann, bob and nobody are cached now, cid is the only one queried
+    query_counter.clear()
+    response = await client.post("/users:batch", json=dict(usernames=["ann", "cid", "nobody"]))
+    assert response.status_code == 200
+    assert list(response.json()["users"]) == ["ann", "cid"]
+    assert response.json()["missing"] == ["nobody"]
+    assert len(query_counter) == 1
+
+
+async def test_get_users_batch_limit(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "USER_BATCH_MAX_SIZE", 2)
+
+    response = await client.get("/users:batch", params=dict(usernames="a,b,c"))
+    assert response.status_code == 422
+    response = await client.post("/users:batch", json=dict(usernames=["a", "b", "a"]))
+    assert response.status_code == 200
+    assert response.json() == dict(users={}, missing=["a", "b"])
+
+
+async def test_get_user_coalesced(client: AsyncClient, test_db: AsyncSession, query_counter: list[str]):
+    for username in ("ann", "bob"):
+        await User.create(test_db, username=username, email=f"{username}@email.com", password="test")
+    query_counter.clear()
+    loads = profile_loader.loads
+
+    responses = await asyncio.gather(*(
+        client.get(f"/users/{username}") for username in ["ann"] * 20 + ["bob"] * 5 + ["nobody"]
+    ))
+    assert [response.status_code for response in responses] == [200] * 25 + [404]
+    assert responses[0].json()["username"] == "ann"
+    assert responses[20].json()["username"] == "bob"
+    assert len(query_counter) == 1
+    assert profile_loader.loads - loads == 26
+
+
+async def test_get_user_replica_opened_on_miss(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        monkeypatch
+):
+    opened = []
+
+    def replica():
+        opened.append(1)
+        return async_session_for_testing()
+
+    monkeypatch.setattr(read_router, "replicas", [replica])
+    # earlier tests wrote this username on this worker
+    read_router.recent_writes.clear()
+    monkeypatch.setattr(profile_loader, "enabled", False)
+    await User.create(test_db, **test_user_credentials)
+
+    for _ in range(3):
+        response = await client.get(f"/users/{test_user_credentials['username']}")
+        assert response.status_code == 200
+    # only the first request missed profile_cache
+    assert len(opened) == 1
+
+
 async def test_update_user(
         client: AsyncClient,
         test_db: AsyncSession,
@@ -64,4 +146,121 @@ async def test_delete_user(
         await User.find_one(test_db, "username", test_user_credentials["username"])
 
 
+async def test_get_user_cache_invalidation(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        query_counter: list[str]
+):
+    # a cached 404 must not survive registration
+    response = await client.get(f"/users/{test_user_credentials['username']}")
+    assert response.status_code == 404
+    await client.post("/auth/register", json=test_user_credentials)
 
+    response = await client.get(f"/users/{test_user_credentials['username']}")
+    assert response.status_code == 200
+    query_counter.clear()
+    response = await client.get(f"/users/{test_user_credentials['username']}")
+    assert response.status_code == 200
+    assert query_counter == []
+
+    token = await create_access_token_for_user(test_user_credentials["username"])
+    await client.patch(
+        f"/users/{test_user_credentials['username']}",
+        json=dict(bio="Updated bio"),
+        headers=dict(token=token)
+    )
+    response = await client.get(f"/users/{test_user_credentials['username']}")
+    assert response.json()["bio"] == "Updated bio"
+
+    await client.delete(f"/users/{test_user_credentials['username']}", headers=dict(token=token))
+    response = await client.get(f"/users/{test_user_credentials['username']}")
+    assert response.status_code == 404
+
+
+async def test_bulk_create_users(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        monkeypatch
+):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    monkeypatch.setattr(settings, "BULK_IMPORT_CHUNK_SIZE", 2)
+    await User.create(test_db, **test_user_credentials)
+    token = await create_access_token_for_user("admin")
+    rows = [
+        dict(username="bulk1", email="bulk1@email.com", password="test"),
+        dict(username="bulk2", email="not an email", password="test"),
+        test_user_credentials,
+        dict(username="bulk3", email="bulk3@email.com", password="test"),
+        dict(username="bulk3", email="bulk4@email.com", password="test"),
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\n\n"
+
+    response = await client.post("/users/bulk", content=body, headers=dict(token=token))
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["created"], result["rejected"]) == (2, 3)
+    assert [error["line"] for error in result["errors"]] == [2, 3, 5]
+
+    assert await User.find_one(test_db, "username", "bulk3")
+    user = await User.find_one(test_db, "username", "bulk1")
+    assert await verify_password(
+        password_salt=user.password_salt,
+        plain_password="test",
+        hashed_password=user.hashed_password
+    )
+
+
+async def test_bulk_create_users_not_admin(client: AsyncClient):
+    token = await create_access_token_for_user("not_an_admin")
+    response = await client.post("/users/bulk", content=b"", headers=dict(token=token))
+    assert response.status_code == 403
+
+
+async def test_list_users(client: AsyncClient, test_db: AsyncSession, monkeypatch):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    token = await create_access_token_for_user("admin")
+    for i in range(5):
+        await User.create(test_db, username=f"user{i}", email=f"user{i}@email.com", password="test")
+    await User.create(test_db, username="other", email="other@email.com", password="test")
+
+    usernames, cursor = [], None
+    while True:
+        params = dict(limit=2, username_prefix="user")
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/users", params=params, headers=dict(token=token))
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        usernames += [user["username"] for user in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert usernames == [f"user{i}" for i in range(5)]
+
+    response = await client.get("/users", params=dict(cursor="not a cursor"), headers=dict(token=token))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("export_format", ("ndjson", "csv"))
+async def test_export_users(client: AsyncClient, test_db: AsyncSession, monkeypatch, export_format: str):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    token = await create_access_token_for_user("admin")
+    for i in range(5):
+        await User.create(test_db, username=f"user{i}", email=f"user{i}@email.com", password="test")
+
+    response = await client.get(
+        "/users/export",
+        params=dict(format=export_format, fetch_size=2),
+        headers=dict(token=token)
+    )
+    assert response.status_code == 200
+    if export_format == "ndjson":
+        users = [json.loads(line) for line in response.text.splitlines()]
+    else:
+        # csv has no null - empty cells stand for None
+        users = [{k: v or None for k, v in user.items()} for user in csv.DictReader(io.StringIO(response.text))]
+    assert [user["username"] for user in users] == [f"user{i}" for i in range(5)]
+    assert all(UserPublic(**user) for user in users)
@@ -1,10 +1,19 @@
+import os
+
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from app.database import get_db
+from app.database import create_db_engine, get_db
 from app.main import app
 from app.models.base import Base
+from app.models.revocation import token_revocations
+from app.models.user import profile_cache, profile_loader
+from app.security.jwt import token_cache
+from app.security.password import password_hasher
+from app.security.throttle import throttle
 from app.settings import settings
 from tests.overwritten_db import engine, async_session_for_testing, get_db_for_testing
 
@@ -12,6 +21,12 @@ from tests.overwritten_db import engine, async_session_for_testing, get_db_for_t
 @pytest_asyncio.fixture(autouse=True)
 async def setup_teardown():
     app.dependency_overrides[get_db] = get_db_for_testing
+    password_hasher.configure(backend="inline")
+    profile_cache.clear()
+    token_cache.clear()
+    throttle.store.clear()
+    token_revocations.clear()
+    profile_loader.session_factory = async_session_for_testing
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -40,6 +55,28 @@ async def test_db():
         await db.close()
 
 
+@pytest_asyncio.fixture()
+async def unreachable_replica():
+    replica_engine = create_db_engine(
+        settings.asyncpg_url_for_tests.replace(f":{os.getenv('SQL_PORT')}/", ":1/")
+    )
+    yield async_sessionmaker(replica_engine, expire_on_commit=False)
+    await replica_engine.dispose()
+
+
+@pytest.fixture()
+def query_counter():
+    """Records every statement sent to the test database while the test runs."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):  # noqa
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture(params=(dict(username="test", email="test@email.com", password="test"),))
 def test_user_credentials(request):
     return request.param
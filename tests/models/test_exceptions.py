@@ -35,4 +35,23 @@ async def test_check_credentials_for_create(test_db: AsyncEngine, test_user_cred
         )
 
 
+@pytest.mark.parametrize(
+    "credentials,detail",
+    (
+            (dict(username="test", email="available@email.com", password="test"), "test is already taken."),
+            (dict(username="available", email="test@email.com", password="test"),
+             "test@email.com already exist in the database."),
+    )
+)
+async def test_create_taken_credentials(
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        credentials: dict[str, str],
+        detail: str
+):
+    await User.create(test_db, **test_user_credentials)
 
+    with pytest.raises(HTTPException) as exc_info:
+        await User.create(test_db, **credentials)
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == detail
@@ -0,0 +1,116 @@
+import asyncio
+import contextlib
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.last_login import LastLoginBuffer, last_login_buffer
+from app.models.user import User
+from tests.overwritten_db import async_session_for_testing
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture()
+def buffer():
+    return LastLoginBuffer(
+        session_factory=async_session_for_testing,
+        enabled=True,
+        flush_interval=60,
+        batch_size=10
+    )
+
+
+async def test_record_and_flush(buffer: LastLoginBuffer, test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    user = await User.create(test_db, **test_user_credentials)
+    created_login_at = user.last_login_at
+
+    buffer.record(user)
+    buffer.record(user)
+    assert buffer.stats()["pending"] == 1
+    assert user.last_login_at > created_login_at
+
+    assert await buffer.flush() == 1
+    assert buffer.stats()["pending"] == 0
+    stmt = select(User.last_login_at).where(User.id == user.id)
+    assert await test_db.scalar(stmt) == user.last_login_at
+
+
+async def test_flush_on_batch_size(
+        buffer: LastLoginBuffer,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str]
+):
+    user = await User.create(test_db, **test_user_credentials)
+    buffer.batch_size = 1
+
+    buffer.record(user)
+    await buffer.stop()
+    assert buffer.stats()["flushed_rows"] == 1
+
+
+def slow_sessions(entered: asyncio.Event):
+    @contextlib.asynccontextmanager
+    async def session_factory():
+        entered.set()
+        await asyncio.sleep(0.05)
+        async with async_session_for_testing() as db_session:
+            yield db_session
+
+    return session_factory
+
+
+async def test_stop_during_flush(buffer: LastLoginBuffer, test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    user = await User.create(test_db, **test_user_credentials)
+    entered = asyncio.Event()
+    buffer.session_factory = slow_sessions(entered)
+    buffer.flush_interval = 0.01
+
+    buffer.record(user)
+    buffer.start()
+    await entered.wait()
+    await buffer.stop()
+
+    assert buffer.stats()["flushed_rows"] == 1
+    assert await test_db.scalar(select(User.last_login_at).where(User.id == user.id)) == user.last_login_at
+
+
+async def test_cancelled_flush_keeps_rows(
+        buffer: LastLoginBuffer,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str]
+):
+    user = await User.create(test_db, **test_user_credentials)
+    entered = asyncio.Event()
+    buffer.session_factory = slow_sessions(entered)
+
+    buffer.record(user)
+    flush = asyncio.create_task(buffer.flush())
+    await entered.wait()
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+
+    assert buffer.stats()["pending"] == 1
+
+
+async def test_login_with_write_behind(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        query_counter: list[str],
+        monkeypatch
+):
+    monkeypatch.setattr(last_login_buffer, "enabled", True)
+    monkeypatch.setattr(last_login_buffer, "session_factory", async_session_for_testing)
+    await User.create(test_db, **test_user_credentials)
+    query_counter.clear()
+
+    response = await client.post("/auth/login", json=test_user_credentials)
+    assert response.status_code == 202
+    assert len(query_counter) == 1
+    assert last_login_buffer.stats()["pending"] == 1
+
+    await last_login_buffer.stop()
+    assert last_login_buffer.stats()["pending"] == 0
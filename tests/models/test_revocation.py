@@ -0,0 +1,153 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.revocation import TokenRevocations, token_revocations
+from app.models.user import User
+from app.security.jwt import create_access_token_for_user, decode_token
+from tests.overwritten_db import async_session_for_testing
+
+pytestmark = pytest.mark.asyncio
+
+
+def other_worker() -> TokenRevocations:
+    return TokenRevocations(
+        session_factory=async_session_for_testing,
+        sync_interval=60,
+        bloom_capacity=1000,
+        bloom_error_rate=0.01,
+        cache_size=100,
+        token_lifetime=timedelta(minutes=30)
+    )
+
+
+async def test_logout(client: AsyncClient, test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    await User.create(test_db, **test_user_credentials)
+    username = test_user_credentials["username"]
+    token = await create_access_token_for_user(username)
+    other_token = await create_access_token_for_user(username)
+
+    response = await client.post("/auth/logout", headers=dict(token=token))
+    assert response.status_code == 204
+
+    response = await client.patch(f"/users/{username}", json=dict(bio="bio"), headers=dict(token=token))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Your token has been revoked."
+    response = await client.post("/auth/logout", headers=dict(token=token))
+    assert response.status_code == 401
+
+    # only the token that logged out
+    response = await client.patch(f"/users/{username}", json=dict(bio="bio"), headers=dict(token=other_token))
+    assert response.status_code == 200
+
+
+async def test_password_change_revokes_older_tokens(
+        client: AsyncClient,
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str]
+):
+    await User.create(test_db, **test_user_credentials)
+    username = test_user_credentials["username"]
+    token = await create_access_token_for_user(username)
+
+    response = await client.patch(f"/users/{username}", json=dict(password="new"), headers=dict(token=token))
+    assert response.status_code == 200
+    response = await client.patch(f"/users/{username}", json=dict(bio="bio"), headers=dict(token=token))
+    assert response.status_code == 401
+
+    new_token = await create_access_token_for_user(username)
+    response = await client.patch(f"/users/{username}", json=dict(bio="bio"), headers=dict(token=new_token))
+    assert response.status_code == 200
+
+
+async def test_sync_from_other_worker(test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    worker, other = other_worker(), other_worker()
+    await worker.sync()
+    username = test_user_credentials["username"]
+    token = await decode_token(await create_access_token_for_user(username))
+    assert not await worker.is_revoked(test_db, token)
+
+    await other.revoke_token(test_db, token)
+    await other.revoke_user(test_db, "someone-else")
+    assert await other.is_revoked(test_db, token)
+    assert not await worker.is_revoked(test_db, token)
+
+    assert await worker.sync() == 2
+    assert await worker.is_revoked(test_db, token)
+    assert await worker.sync() == 2  # the overlap reads them again
+    assert worker.stats()["bloom"]["count"] == 2
+
+
+async def test_revoked_during_rebuild(test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    worker = other_worker()
+    read, resume = asyncio.Event(), asyncio.Event()
+
+    @asynccontextmanager
+    async def slow_sessions():
+        async with async_session_for_testing() as db_session:
+            yield db_session
+        # the rows are read, the new filter is not swapped in yet
+        read.set()
+        await resume.wait()
+
+    worker.session_factory = slow_sessions
+    sync = asyncio.create_task(worker.sync())
+    await read.wait()
+    token = await decode_token(await create_access_token_for_user(test_user_credentials["username"]))
+    await worker.revoke_token(test_db, token)
+    resume.set()
+    await sync
+
+    assert worker.loaded
+    assert await worker.is_revoked(test_db, token)
+
+
+async def test_full_filter_is_rebuilt(test_db: AsyncSession):
+    worker, other = other_worker(), other_worker()
+    worker.bloom_capacity = 2
+    await worker.sync()
+    for username in ("a", "b", "c"):
+        await other.revoke_user(test_db, username)
+
+    await worker.sync()
+    assert worker.stats()["bloom"]["capacity"] == 2
+    # the next sync starts over, sized for the live revocations
+    await worker.sync()
+    assert worker.stats()["bloom"]["capacity"] == 6
+    assert worker.stats()["bloom"]["count"] == 3
+    assert worker.stats()["oversized_rebuilds"] == 1
+    for username in ("a", "b", "c"):
+        assert await worker._revoked_at(test_db, f"user:{username}") is not None
+
+
+async def test_not_revoked_without_queries(
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        query_counter: list[str]
+):
+    worker = other_worker()
+    token = await decode_token(await create_access_token_for_user(test_user_credentials["username"]))
+    # until the first sync, the database is asked
+    assert not await worker.is_revoked(test_db, token)
+    assert worker.db_checks == 2
+
+    await worker.sync()
+    query_counter.clear()
+    for _ in range(10):
+        assert not await worker.is_revoked(test_db, token)
+    assert query_counter == []
+    assert worker.db_checks == 2
+
+
+async def test_delete_revokes(client: AsyncClient, test_db: AsyncSession, test_user_credentials: dict[str, str]):
+    await User.create(test_db, **test_user_credentials)
+    username = test_user_credentials["username"]
+    token = await create_access_token_for_user(username)
+
+    response = await client.delete(f"/users/{username}", headers=dict(token=token))
+    assert response.status_code == 200
+    assert await token_revocations.is_revoked(test_db, await decode_token(token))
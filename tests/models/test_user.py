@@ -85,9 +85,28 @@ async def test_is_taken(test_db: AsyncSession, test_user_credentials: dict[str,
     assert not await User.is_taken(test_db, "email", "available_email")
 
 
+async def test_lookup_statements(test_db: AsyncSession):
+    assert User.lookup_statement("username") is User.lookup_statement("username")
+    assert User.lookup_statement("username") is not User.lookup_statement("username", "column")
+
+    with pytest.raises(ValueError):
+        await User.find_one_or_none(test_db, "bio", "Bio")
+    with pytest.raises(ValueError):
+        await User.is_taken(test_db, "hashed_password", "")
+
+
 async def test_update_last_login_at(test_db: AsyncSession, test_user_credentials: dict[str, str]):
     user = await User.create(test_db, **test_user_credentials)
     last_login_at = user.last_login_at
     await user.update_last_login_at(test_db)
     assert last_login_at < user.last_login_at
 
+
+async def test_create_query_count(
+        test_db: AsyncSession,
+        test_user_credentials: dict[str, str],
+        query_counter: list[str]
+):
+    await User.create(test_db, **test_user_credentials)
+    assert len(query_counter) == 1
+    assert query_counter[0].lstrip().startswith("INSERT")
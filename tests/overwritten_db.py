@@ -1,9 +1,10 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from app.database import create_db_engine
 from app.settings import settings
 
 
-engine = create_async_engine(settings.asyncpg_url_for_tests)
+engine = create_db_engine(settings.asyncpg_url_for_tests)
 
 async_session_for_testing = async_sessionmaker(
     engine,
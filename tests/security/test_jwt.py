@@ -0,0 +1,32 @@
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.security.jwt import create_access_token_for_user, create_jwt_token, decode_token, token_cache
+from app.settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_decode_token_cache():
+    token = await create_access_token_for_user("test")
+
+    assert (await decode_token(token)).username == "test"
+    assert token_cache.stats()["size"] == 1
+    hits = token_cache.hits
+    assert (await decode_token(token)).username == "test"
+    assert token_cache.hits == hits + 1
+
+
+async def test_invalid_token_not_cached():
+    token = await create_jwt_token(
+        payload=dict(username="test"),
+        secret_key="not_the_secret_key",
+        expires_delta=datetime.timedelta(minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+    )
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await decode_token(token)
+    assert token_cache.stats()["size"] == 0
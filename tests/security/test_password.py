@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.security.calibrate import calibrate
+from app.security.password import (
+    PasswordHasher, password_hasher, generate_salt, get_password_hash, verify_password
+)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", PasswordHasher.backends)
+async def test_hash_and_verify(backend: str):
+    password_hasher.configure(backend=backend, workers=2)
+    try:
+        salt = await generate_salt()
+        hashed_password = await get_password_hash(password_salt=salt, plain_password="test")
+        assert hashed_password.startswith("$2b$")
+        assert await verify_password(password_salt=salt, plain_password="test", hashed_password=hashed_password)
+        assert not await verify_password(password_salt=salt, plain_password="wrong", hashed_password=hashed_password)
+        assert password_hasher.stats()["completed"] == 3
+    finally:
+        password_hasher.configure(backend="inline")
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight():
+    password_hasher.configure(backend="thread", workers=4, max_in_flight=1)
+    try:
+        salt = await generate_salt()
+        await asyncio.gather(*(get_password_hash(password_salt=salt, plain_password="test") for _ in range(3)))
+        stats = password_hasher.stats()
+        assert stats["completed"] == 3
+        assert stats["max_queued"] == 2
+        assert stats["queued"] == stats["in_flight"] == 0
+        assert stats["wait_seconds_max"] > 0
+    finally:
+        password_hasher.configure(backend="inline")
+
+
+@pytest.mark.asyncio
+async def test_bulk_lane():
+    password_hasher.configure(backend="thread", workers=4, max_in_flight=2, bulk_max_in_flight=1)
+    try:
+        salt = await generate_salt()
+        bulk = [
+            asyncio.create_task(get_password_hash(password_salt=salt, plain_password="test", bulk=True))
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0)
+        stats = password_hasher.stats()
+        # one bulk hash holds a slot, the other slot is left to logins
+        assert (stats["bulk_queued"], stats["queued"], stats["in_flight"]) == (3, 0, 1)
+        await get_password_hash(password_salt=salt, plain_password="test")
+        assert not all(task.done() for task in bulk)
+        assert password_hasher.stats()["wait_seconds_max"] < 0.05
+
+        await asyncio.gather(*bulk)
+        assert password_hasher.stats()["completed"] == 5
+    finally:
+        password_hasher.configure(backend="inline")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        PasswordHasher(backend="gpu")
+
+
+def test_calibrate(caplog: pytest.LogCaptureFixture):
+    recommended, timings = calibrate(target_seconds=60, min_rounds=4, max_rounds=5, samples=1)
+    assert recommended == 5
+    assert list(timings) == [4, 5]
+
+    assert not caplog.records
+
+    recommended, timings = calibrate(target_seconds=0, min_rounds=4, max_rounds=5, samples=1)
+    assert recommended == 4
+    assert list(timings) == [4]
+    # the target cannot be met
+    assert "over the 0.0 ms target" in caplog.records[-1].getMessage()
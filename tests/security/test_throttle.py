@@ -0,0 +1,137 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import read_router
+from app.security.throttle import MemoryStore, SharedMemoryStore, SlidingWindow, TokenBucket, throttle
+
+
+def test_token_bucket():
+    bucket = TokenBucket(MemoryStore(maxsize=10, ttl=60), capacity=2, rate=0.5)
+    assert bucket.acquire("ip", now=0) == 0
+    assert bucket.acquire("ip", now=0) == 0
+    assert bucket.acquire("ip", now=0) == 2
+    assert bucket.acquire("ip", now=1) == 1
+    assert bucket.acquire("ip", now=2) == 0
+    assert bucket.acquire("other", now=2) == 0
+
+
+def test_sliding_window():
+    window = SlidingWindow(MemoryStore(maxsize=10, ttl=60), limit=2, window=10)
+    window.hit("account", now=0)
+    assert window.retry_after("account", now=1) == 0
+    window.hit("account", now=5)
+    # both hits are in the current window, which has to end first
+    assert window.retry_after("account", now=5) == 5
+    assert window.retry_after("account", now=11) == 0
+
+    # the previous window's hits count for the part of it the sliding window still covers
+    window.hit("account", now=11)
+    assert window.retry_after("account", now=11) == 4
+    assert window.retry_after("account", now=15.5) == 0
+    assert window.retry_after("account", now=40) == 0
+
+
+def test_shared_memory_store():
+    name = f"throttle-test-{uuid.uuid4().hex[:8]}"
+    first, second = SharedMemoryStore(name, slots=64), SharedMemoryStore(name, slots=64)
+    try:
+        first.set("key", (1.0, 2.0, 3.0))
+        assert second.get("key") == (1.0, 2.0, 3.0)
+        assert second.get("other") is None
+
+        bucket = TokenBucket(second, capacity=1, rate=1)
+        assert bucket.acquire("ip", now=0) == 0
+        assert TokenBucket(first, capacity=1, rate=1).acquire("ip", now=0) == 1
+    finally:
+        first.clear()
+        first.unlink()
+        first.close()
+        second.close()
+
+
+def test_shared_memory_store_resized():
+    name = f"throttle-test-{uuid.uuid4().hex[:8]}"
+    small = SharedMemoryStore(name, slots=4)
+    small.set("key", (1.0, 2.0, 3.0))
+    # THROTTLE_STORE_SIZE raised since the segment was created
+    large = SharedMemoryStore(name, slots=64)
+    try:
+        assert large._memory.size == 64 * SharedMemoryStore.slot.size  # noqa
+        for index in range(200):
+            large.set(f"key-{index}", (1.0, 2.0, 3.0))
+        assert large.get("key") is None
+        # a worker started after the change attaches to the new one
+        attached = SharedMemoryStore(name, slots=64)
+        assert attached.get("key-199") == (1.0, 2.0, 3.0)
+        attached.close()
+    finally:
+        large.unlink()
+        large.close()
+        small.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_logins_throttled(
+        client: AsyncClient, test_user_credentials: dict[str, str], query_counter: list[str], monkeypatch
+):
+    monkeypatch.setattr(throttle.account_failures, "limit", 2)
+    await client.post("/auth/register", json=test_user_credentials)
+    wrong = dict(username=test_user_credentials["username"], password="wrong")
+    for _ in range(2):
+        assert (await client.post("/auth/login", json=wrong)).status_code == 403
+
+    query_counter.clear()
+    response = await client.post("/auth/login", json=test_user_credentials)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert query_counter == []
+
+    # other accounts are not affected
+    response = await client.post("/auth/login", json=dict(username="other", password="wrong"))
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_alternating_username_and_email(
+        client: AsyncClient, test_user_credentials: dict[str, str], monkeypatch
+):
+    monkeypatch.setattr(throttle.account_failures, "limit", 2)
+    await client.post("/auth/register", json=test_user_credentials)
+    by_username = dict(username=test_user_credentials["username"], password="wrong")
+    by_email = dict(email=test_user_credentials["email"], password="wrong")
+    assert (await client.post("/auth/login", json=by_username)).status_code == 403
+    assert (await client.post("/auth/login", json=by_email)).status_code == 403
+
+    for credentials in (by_username, by_email):
+        assert (await client.post("/auth/login", json=credentials)).status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_throttled_login_skips_the_replicas(
+        client: AsyncClient, unreachable_replica: async_sessionmaker, monkeypatch
+):
+    monkeypatch.setattr(throttle.requests, "capacity", 0)
+    monkeypatch.setattr(read_router, "replicas", [unreachable_replica])
+    replica_failures = read_router.replica_failures
+
+    response = await client.post("/auth/login", json=dict(username="test", password="test"))
+    assert response.status_code == 429
+    assert read_router.replica_failures == replica_failures
+
+
+@pytest.mark.asyncio
+async def test_register_burst(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(throttle.requests, "capacity", 2)
+    for i in range(2):
+        response = await client.post(
+            "/auth/register", json=dict(username=f"user{i}", email=f"user{i}@email.com", password="test")
+        )
+        assert response.status_code == 201
+    response = await client.post(
+        "/auth/register", json=dict(username="user2", email="user2@email.com", password="test")
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
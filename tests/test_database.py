@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.database import ReadRouter, pool_stats
+from app.security.jwt import create_access_token_for_user
+from app.settings import settings
+from tests.overwritten_db import engine, async_session_for_testing
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_pool_stats(test_db: AsyncSession):
+    await test_db.execute(text("SELECT 1"))
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 1
+    assert stats["checkout_wait_seconds"]["count"] >= 1
+
+    await test_db.close()
+    assert pool_stats(engine)["checked_out"] == 0
+
+
+async def test_get_pool_stats(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    token = await create_access_token_for_user("admin")
+    response = await client.get("/internal/pool", headers=dict(token=token))
+    assert response.status_code == 200
+    assert all(key in response.json() for key in
+               ["size", "checked_in", "checked_out", "overflow", "timeouts", "connect_failures",
+                "checkout_wait_seconds"]
+               )
+
+
+async def test_get_pool_stats_not_admin(client: AsyncClient):
+    assert (await client.get("/internal/pool")).status_code == 422
+    token = await create_access_token_for_user("not_an_admin")
+    assert (await client.get("/internal/pool", headers=dict(token=token))).status_code == 403
+
+
+async def test_read_router_round_robin(unreachable_replica: async_sessionmaker):
+    router = ReadRouter(replicas=[unreachable_replica, async_session_for_testing], read_your_writes_seconds=60)
+
+    for _ in range(2):
+        db = await router.replica_session()
+        assert db is not None
+        assert (await db.execute(text("SELECT 1"))).scalar() == 1
+        await db.close()
+    # the unreachable replica was tried once per call
+    assert router.replica_failures == 2
+
+
+async def test_read_router_falls_back_to_primary(unreachable_replica: async_sessionmaker):
+    router = ReadRouter(replicas=[unreachable_replica], read_your_writes_seconds=60)
+    assert await router.replica_session() is None
+    assert router.replica_failures == 1
+
+
+async def test_read_router_skips_unreachable_replica(unreachable_replica: async_sessionmaker):
+    router = ReadRouter(
+        replicas=[unreachable_replica, async_session_for_testing], read_your_writes_seconds=60, cooldown_seconds=60
+    )
+
+    for _ in range(3):
+        db = await router.replica_session()
+        assert db is not None
+        await db.close()
+    assert router.replica_failures == 1
+    assert router.unhealthy_replicas == 1
+
+    # tried again once the cooldown is over
+    router._unhealthy_until = dict.fromkeys(router._unhealthy_until, time.monotonic())
+    await (await router.replica_session()).close()
+    assert router.replica_failures == 2
+
+
+async def test_read_router_read_your_writes():
+    router = ReadRouter(replicas=[async_session_for_testing], read_your_writes_seconds=60)
+    router.mark_written("test")
+
+    assert await router.replica_session("test") is None
+    db = await router.replica_session("other_user")
+    assert db is not None
+    await db.close()
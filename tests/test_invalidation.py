@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sys
+import textwrap
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.invalidation import CHANNEL, InvalidationBus
+from app.models.revocation import RevokedToken
+from app.models.user import User
+from app.settings import settings
+from app.utils.cache import LRUCache
+
+pytestmark = pytest.mark.asyncio
+
+
+def create_bus() -> InvalidationBus:
+    bus = InvalidationBus(
+        dsn=settings.asyncpg_url_for_tests,
+        channel=CHANNEL,
+        enabled=True,
+        reconnect_interval=0.05,
+        health_check_interval=0.05
+    )
+    # the worker's caches, kept on the bus for the assertions
+    bus.cache = LRUCache(maxsize=100)
+    bus.register("profile", bus.cache.delete, bus.cache.clear)
+    bus.revocations = LRUCache(maxsize=100)
+    bus.register("revocations", bus.revocations.delete, bus.revocations.clear)
+    return bus
+
+
+def user_row(username: str) -> dict[str, str]:
+    return dict(username=username, email=f"{username}@example.com", hashed_password="-", password_salt="-")
+
+
+async def until(condition, timeout: float = 5.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest_asyncio.fixture()
+async def workers():
+    buses = [create_bus() for _ in range(3)]
+    for bus in buses:
+        bus.start()
+    await until(lambda: all(bus.connected for bus in buses))
+    for bus in buses:
+        bus.cache.set("alice", "stale")
+        bus.cache.set("bob", "fresh")
+        bus.revocations.set("jti:abc", None)
+    yield buses
+    for bus in buses:
+        await bus.stop()
+
+
+async def test_write_evicts_on_every_worker(workers: list[InvalidationBus], test_db: AsyncSession):
+    await test_db.execute(insert(User).values(user_row("alice")))
+    await test_db.commit()
+
+    await until(lambda: all(bus.received == 1 for bus in workers))
+    for bus in workers:
+        assert bus.cache.get("alice") is None
+        assert bus.cache.get("bob") == "fresh"
+        assert bus.lag.count == 1
+
+
+async def test_update_and_delete_evict(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    await test_db.execute(insert(User).values([user_row("alice"), user_row("bob")]))
+    await test_db.commit()
+    await until(lambda: other.received == 1)
+
+    other.cache.set("alice", "stale")
+    await test_db.execute(update(User).where(User.username == "alice").values(bio="new"))
+    await test_db.commit()
+    await until(lambda: other.received == 2)
+    assert other.cache.get("alice") is None
+
+    other.cache.set("bob", "stale")
+    await test_db.execute(delete(User).where(User.username == "bob"))
+    await test_db.commit()
+    await until(lambda: other.received == 3)
+    assert other.cache.get("bob") is None
+
+
+async def test_write_without_rows_is_not_notified(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    await test_db.execute(update(User).where(User.username == "nobody").values(bio="new"))
+    await test_db.execute(insert(User).values(user_row("bob")))
+    await test_db.commit()
+
+    await until(lambda: other.received == 1)
+    assert other.cache.get("alice") == "stale"
+
+
+async def test_rolled_back_write_is_not_notified(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    await test_db.execute(insert(User).values(user_row("alice")))
+    await test_db.rollback()
+    await test_db.execute(insert(User).values(user_row("bob")))
+    await test_db.commit()
+
+    await until(lambda: other.received == 1)
+    assert other.cache.get("alice") == "stale"
+    assert other.cache.get("bob") is None
+
+
+async def test_revocation_keys(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    now = datetime.now(timezone.utc)
+    await test_db.execute(insert(RevokedToken).values(jti="abc", expires_at=now - timedelta(seconds=1), revoked_at=now))
+    await test_db.commit()
+    await until(lambda: other.received == 1)
+    assert other.revocations.get("jti:abc", "evicted") == "evicted"
+    assert other.cache.get("alice") == "stale"
+
+    # pruning expired rows revokes nothing
+    await test_db.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+    await test_db.execute(insert(User).values(user_row("bob")))
+    await test_db.commit()
+    await until(lambda: other.received == 2)
+
+
+async def test_large_write_is_split(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    flushes = other.flushes
+    usernames = [f"a-rather-long-username-{i:05}" for i in range(2000)]
+    other.cache.set(usernames[0], "stale")
+    other.cache.set(usernames[-1], "stale")
+    await test_db.execute(insert(User).values([user_row(username) for username in usernames]))
+    await test_db.commit()
+
+    await until(lambda: other.cache.get(usernames[-1]) is None)
+    assert other.received > 1
+    assert other.cache.get(usernames[0]) is None
+    # evicted key by key, nothing flushed
+    assert other.flushes == flushes
+    assert other.cache.get("bob") == "fresh"
+
+
+async def test_500_row_update_evicts(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    usernames = [f"user-with-a-long-name-{i:03}" for i in range(500)]
+    await test_db.execute(insert(User).values([user_row(username) for username in usernames]))
+    await test_db.commit()
+    await until(lambda: other.received >= 2)
+    received, flushes = other.received, other.flushes
+
+    other.cache.set(usernames[-1], "stale")
+    await test_db.execute(update(User).where(User.username.in_(usernames)).values(bio="new"))
+    await test_db.commit()
+
+    await until(lambda: other.cache.get(usernames[-1]) is None)
+    assert other.received == received + 2
+    assert other.flushes == flushes
+    assert other.cache.get("alice") == "stale"
+
+
+async def test_reconnect_flushes(workers: list[InvalidationBus], test_db: AsyncSession):
+    _, other, _ = workers
+    flushes = other.flushes
+
+    await test_db.execute(
+        text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE application_name = :name"),
+        dict(name=other.name)
+    )
+    await until(lambda: other.reconnects == 1 and other.connected)
+
+    assert other.flushes == flushes + 1
+    assert len(other.cache) == 0
+
+
+async def test_write_from_another_process(workers: list[InvalidationBus]):
+    script = textwrap.dedent("""
+        import asyncio
+
+        import asyncpg
+
+        from app.settings import settings
+
+
+        async def main():
+            connection = await asyncpg.connect(settings.asyncpg_url_for_tests.replace("+asyncpg", ""))
+            await connection.execute(
+                "INSERT INTO users (username, email, hashed_password, password_salt) "
+                "VALUES ('alice', 'alice@example.com', '-', '-'), ('bob', 'bob@example.com', '-', '-')"
+            )
+            await connection.close()
+
+        asyncio.run(main())
+    """)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", script, env=dict(os.environ, PYTHONPATH=os.getcwd())
+    )
+    assert await process.wait() == 0
+
+    await until(lambda: all(bus.received == 1 for bus in workers))
+    assert all(len(bus.cache) == 0 for bus in workers)
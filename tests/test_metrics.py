@@ -0,0 +1,68 @@
+import pytest
+from httpx import AsyncClient
+
+from app.security.jwt import create_access_token_for_user
+from app.settings import settings
+from app.utils.metrics import metrics
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+
+
+async def test_request_metrics(client: AsyncClient, test_user_credentials: dict[str, str]):
+    await client.post("/auth/register", json=test_user_credentials)
+    await client.post("/auth/login", json=test_user_credentials)
+    await client.get(f"/users/{test_user_credentials['username']}")
+    await client.get("/users/nobody")
+    await client.get("/no/such/route")
+
+    assert metrics.requests[("GET", "/users/{username}", 200)] == 1
+    assert metrics.requests[("GET", "/users/{username}", 404)] == 1
+    assert metrics.requests[("GET", "unmatched", 404)] == 1
+    assert metrics.in_flight == 0
+
+    register = metrics.db_queries[("POST", "/auth/register")]
+    assert register.count == 1 and register.sum >= 1
+    assert metrics.db_seconds[("POST", "/auth/register")].sum > 0
+    assert metrics.sections["bcrypt_hash"].count == 1
+    assert metrics.sections["bcrypt_verify"].count == 1
+    assert metrics.sections["jwt_encode"].count == 1
+
+
+async def test_get_metrics(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, "admin_usernames", ["admin"])
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    await client.get("/internal/pool", headers=dict(token=await create_access_token_for_user("admin")))
+    response = await client.get("/metrics", headers=dict(Authorization="Bearer scrape-secret"))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/internal/pool",status="200"} 1' in response.text
+    assert "db_pool_checkout_wait_seconds_count" in response.text
+    assert "db_replica_failures_total" in response.text
+    assert "cache_invalidation_lag_seconds_count" in response.text
+    assert "user_lookup_batch_size_bucket" in response.text
+    assert "password_hash_queued 0" in response.text
+    assert "password_hash_wait_seconds_total" in response.text
+    assert 'cache_hits_total{cache="profile"}' in response.text
+    assert 'cache_entries{cache="token"}' in response.text
+    assert "throttle_rejected_total" in response.text
+    assert "token_revocations_loaded 0" in response.text
+    assert "token_revocations_bloom_keys" in response.text
+    assert "token_revocations_bloom_oversized_total 0" in response.text
+    assert "last_login_pending" in response.text
+
+
+async def test_get_metrics_without_scrape_token(client: AsyncClient, monkeypatch):
+    # refused until a token is configured
+    assert (await client.get("/metrics", headers=dict(Authorization="Bearer "))).status_code == 401
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert (await client.get("/metrics")).status_code == 401
+    response = await client.get("/metrics", headers=dict(Authorization="Bearer wrong"))
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
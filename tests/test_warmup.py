@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import pool_stats
+from app.warmup import WarmUp, warm_up
+from tests.overwritten_db import async_session_for_testing, engine
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_warm_up():
+    warm = WarmUp(
+        session_factory=async_session_for_testing, replicas=[], enabled=True, connections=3, retry_interval=1
+    )
+    assert not warm.ready
+
+    await warm.run()
+    assert warm.ready
+    assert pool_stats(engine)["checked_in"] >= 3
+    assert set(warm.stats()["step_seconds"]) == {"primary", "password_hashing", "jwt"}
+
+
+async def test_warm_up_retries(unreachable_replica: async_sessionmaker):
+    warm = WarmUp(
+        session_factory=async_session_for_testing, replicas=[unreachable_replica], enabled=True, connections=1,
+        retry_interval=0.01
+    )
+    warm.start()
+    await asyncio.sleep(0.5)
+    await warm.stop()
+
+    assert not warm.ready
+    assert warm.attempts > 1
+
+
+async def test_ready(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(warm_up, "ready", False)
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+    monkeypatch.setattr(warm_up, "ready", True)
+    assert (await client.get("/health/ready")).status_code == 200
+    assert (await client.get("/health/live")).status_code == 200
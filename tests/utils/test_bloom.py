@@ -0,0 +1,35 @@
+from app.utils.bloom import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"key-{i}")
+
+    assert all(f"key-{i}" in bloom for i in range(1000))
+    # false positives among them are not counted
+    assert 980 <= bloom.count <= 1000
+    for i in range(1000, 1100):
+        bloom.add(f"key-{i}")
+    assert bloom.is_full
+
+
+def test_count_distinct_keys():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    assert bloom.add("key")
+    assert not bloom.add("key")
+    assert bloom.add("other")
+
+    assert bloom.count == 2
+    assert not bloom.is_full
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"key-{i}")
+
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+    # 9.6 bits per key at 1%
+    assert bloom.stats()["bytes"] == 1199
@@ -0,0 +1,45 @@
+import time
+
+from app.utils.cache import LRUCache, NullCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == dict(size=2, maxsize=2, hits=3, misses=1, evictions=1, expirations=0)
+
+
+def test_ttl():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") == 1
+    assert cache.get("b", "missing") == "missing"
+    assert cache.stats()["expirations"] == 1
+
+
+def test_set_skipped_after_invalidation():
+    cache = LRUCache(maxsize=10)
+    generation = cache.generation
+    cache.delete("a")
+    cache.set("a", "stale", generation=generation)
+    assert cache.get("a") is None
+
+    cache.set("a", "fresh", generation=cache.generation)
+    assert cache.get("a") == "fresh"
+
+
+def test_null_cache():
+    cache = NullCache()
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.utils.coalesce import BatchLoader
+
+
+class UppercaseLoader(BatchLoader):
+    def __init__(self, **kwargs):
+        super().__init__(**dict(dict(enabled=True, window=0.0, max_batch_size=10, max_in_flight=1), **kwargs))
+        self.calls = []
+        self.error = None
+
+    async def load_many(self, keys: list[str]) -> dict[str, str]:
+        self.calls.append(keys)
+        await asyncio.sleep(0.01)
+        if self.error is not None:
+            raise self.error
+        return {key: key.upper() for key in keys if key != "missing"}
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    loader = UppercaseLoader()
+
+    results = await asyncio.gather(*(loader.load("a") for _ in range(20)))
+    assert results == ["A"] * 20
+    assert loader.calls == [["a"]]
+    assert loader.stats()["shared"] == 19
+
+    # nothing is kept once the batch is done
+    assert await loader.load("a") == "A"
+    assert len(loader.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_batches_distinct_keys():
+    loader = UppercaseLoader()
+
+    results = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("missing"), loader.load("a"))
+    assert results == ["A", "B", None, "A"]
+    assert loader.calls == [["a", "b", "missing"]]
+
+
+@pytest.mark.asyncio
+async def test_window():
+    loader = UppercaseLoader(window=0.05)
+
+    async def load_later(key: str, delay: float) -> str:
+        await asyncio.sleep(delay)
+        return await loader.load(key)
+
+    assert await asyncio.gather(load_later("a", 0), load_later("b", 0.01)) == ["A", "B"]
+    assert loader.calls == [["a", "b"]]
+
+
+@pytest.mark.asyncio
+async def test_max_batch_size_and_order():
+    loader = UppercaseLoader(max_batch_size=3)
+    keys = [f"key-{i}" for i in range(7)]
+    finished = []
+
+    async def load(key: str) -> None:
+        await loader.load(key)
+        finished.append(key)
+
+    await asyncio.gather(*(load(key) for key in keys))
+    # one batch at a time, in the order the keys arrived
+    assert loader.calls == [keys[:3], keys[3:6], keys[6:]]
+    assert finished == keys
+    assert loader.stats()["batch_sizes"]["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    loader = UppercaseLoader()
+    loader.error = ValueError("database is down")
+
+    results = await asyncio.gather(loader.load("a"), loader.load("a"), loader.load("b"), return_exceptions=True)
+    assert all(result is loader.error for result in results)
+
+    loader.error = None
+    assert await loader.load("a") == "A"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_others():
+    loader = UppercaseLoader()
+    first = asyncio.create_task(loader.load("a"))
+    second = asyncio.create_task(loader.load("a"))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    assert await second == "A"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_forget_starts_a_new_lookup():
+    loader = UppercaseLoader()
+    first = asyncio.create_task(loader.load("a"))
+    await asyncio.sleep(0.005)
+    # the lookup is in flight - a load after the key changed must not join it
+    loader.forget("a")
+    second = asyncio.create_task(loader.load("a"))
+
+    assert await asyncio.gather(first, second) == ["A", "A"]
+    assert loader.calls == [["a"], ["a"]]
+    assert loader.stats()["shared"] == 0
+    assert not loader._futures
+
+
+@pytest.mark.asyncio
+async def test_forget_keeps_pending_keys():
+    loader = UppercaseLoader(window=0.01)
+    first = asyncio.create_task(loader.load("a"))
+    await asyncio.sleep(0)
+    loader.forget("a")
+    loader.forget_all()
+
+    assert await asyncio.gather(first, loader.load("a")) == ["A", "A"]
+    assert loader.calls == [["a"]]
+
+
+def test_load_many_is_abstract():
+    with pytest.raises(TypeError):
+        BatchLoader(enabled=True, window=0.0, max_batch_size=10, max_in_flight=1)
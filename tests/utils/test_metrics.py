@@ -0,0 +1,25 @@
+from app.utils.metrics import Histogram, Metrics, RequestStats, render_prometheus
+
+
+def test_histogram_snapshot_is_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.snapshot() == dict(count=4, sum=6.05, buckets={"0.1": 1, "1.0": 3, "+Inf": 4})
+
+
+def test_render_prometheus():
+    registry = Metrics()
+    stats = RequestStats()
+    stats.queries, stats.db_seconds = 2, 0.003
+    registry.observe_request("GET", "/users/{username}", 200, 0.02, stats)
+    with registry.timed("jwt_decode"):
+        pass
+
+    text = render_prometheus(registry, extra=["custom_metric 1"])
+    assert 'http_requests_total{method="GET",route="/users/{username}",status="200"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/{username}",le="0.025"} 1' in text
+    assert 'http_request_db_queries_sum{method="GET",route="/users/{username}"} 2' in text
+    assert 'section_duration_seconds_count{section="jwt_decode"} 1' in text
+    assert text.endswith("custom_metric 1\n")
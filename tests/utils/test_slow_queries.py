@@ -0,0 +1,57 @@
+import logging
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import slow_query_log
+from app.models.user import User
+from app.utils.slow_queries import SlowQueryLog, parameters_shape
+
+
+@pytest.fixture()
+def log_every_query():
+    threshold, explain = slow_query_log.threshold_seconds, slow_query_log.explain
+    slow_query_log.threshold_seconds, slow_query_log.explain = 0, True
+    yield
+    slow_query_log.threshold_seconds, slow_query_log.explain = threshold, explain
+
+
+def test_parameters_shape():
+    assert parameters_shape(("test", 1)) == ["str", "int"]
+    assert parameters_shape(dict(username="test")) == dict(username="str")
+    assert parameters_shape([("a", 1), ("b", 2)]) == "2 x ['str', 'int']"
+
+
+@pytest.mark.asyncio
+async def test_explain_unindexed_lookup(
+        log_every_query, caplog: pytest.LogCaptureFixture, test_db: AsyncSession,
+        test_user_credentials: dict[str, str]
+):
+    await User.create(test_db, **test_user_credentials)
+    with caplog.at_level(logging.WARNING, logger="app.utils.slow_queries"):
+        assert not await test_db.scalar(select(User.id).where(User.bio == "nobody"))
+
+    record = caplog.records[-1].getMessage()
+    assert "parameters=['str']" in record
+    assert "nobody" not in record.split("Seq Scan")[0]
+    assert "Seq Scan on users" in record
+
+
+@pytest.mark.asyncio
+async def test_failed_explain_keeps_transaction(test_db: AsyncSession):
+    conn = await test_db.connection()
+    plan = await conn.run_sync(SlowQueryLog._explain, "SELECT no_such_column FROM users", ())
+
+    assert plan.startswith("EXPLAIN failed")
+    assert (await test_db.execute(text("SELECT 1"))).scalar() == 1
+
+
+@pytest.mark.asyncio
+async def test_endpoint_is_logged(
+        log_every_query, caplog: pytest.LogCaptureFixture, client: AsyncClient
+):
+    with caplog.at_level(logging.WARNING, logger="app.utils.slow_queries"):
+        await client.get("/users/nobody")
+    assert "endpoint=GET /users/nobody (app.api.user.get_user)" in caplog.text